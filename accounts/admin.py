@@ -18,7 +18,11 @@ from django.urls import path, reverse
 from django.contrib import messages
 import csv, io
 
-from .models import CustomUser, Attendance, LeaveRequest, FaceChangeRequest, UserFace, MasterUserRecord
+from .models import CustomUser, Attendance, AttendanceEvent, ClassRoster, FaceTemplate, LeaveRequest, FaceChangeRequest, UserFace, MasterUserRecord
+from .attendance_log import project_pending
+from .face_embeddings import add_user_embedding
+from .face_index import notify_gallery_change
+from .face_templates import add_numbered_template, record_template, relative_path
 
 
 
@@ -93,6 +97,9 @@ class CustomAdminSite(admin.AdminSite):
                         shutil.copy(src_path, dest_path)
                         record.face_image = f"faces/{username}/{username}_default.jpg"
                         record.save()
+                        record_template(username, dest_path, "master_upload")
+                        add_user_embedding(username, dest_path)
+                        notify_gallery_change(username, "master_upload")
     
                 if created:
                     created_count += 1
@@ -148,6 +155,7 @@ class CustomAdminSite(admin.AdminSite):
     # Dashboard Context
     # ---------------------------
     def get_dashboard_context(self, request):
+        project_pending()
         today_total = Attendance.objects.filter(date= date.today()).count()
         total_users = CustomUser.objects.count()
         today_attendance_percent = round((today_total / total_users) * 100, 2) if total_users else 0
@@ -291,12 +299,18 @@ class AttendanceAdmin(admin.ModelAdmin):
         ]
         return custom_urls + urls
 
+    def get_queryset(self, request):
+        # Row change/delete pages read the projection too
+        project_pending()
+        return super().get_queryset(request)
+
     # Redirect changelist to custom view
     def changelist_view(self, request, extra_context=None):
         url = reverse('admin:all_users_attendance', current_app=self.admin_site.name)
         return redirect(url)
 
     def all_users_attendance_view(self, request):
+        project_pending()
         user_type_filter = request.GET.get("user_type", "")
         search_query = request.GET.get("search", "")
         export_type = request.GET.get("export")  # attendance / leave
@@ -529,8 +543,6 @@ class FaceChangeRequestAdmin(admin.ModelAdmin):
         for obj in queryset:
             try:
                 user = obj.user
-                user_folder = os.path.join(settings.MEDIA_ROOT, "faces", user.username)
-                os.makedirs(user_folder, exist_ok=True)
     
                 # Determine source path of new face
                 src_path = None
@@ -542,20 +554,17 @@ class FaceChangeRequestAdmin(admin.ModelAdmin):
                 if not src_path:
                     continue
                 
-                # Count existing images to create next number
-                existing_files = [f for f in os.listdir(user_folder) if f.startswith(user.username) and f.endswith(".jpg")]
-                next_index = len(existing_files) + 1
-                dest_path = os.path.join(user_folder, f"{user.username}_{next_index}.jpg")
-    
-                # Copy new face
-                shutil.copy(src_path, dest_path)
+                # Copy new face under the next catalogued number
+                dest_path = add_numbered_template(user.username, "admin_approval", src_path=src_path)
     
-                # Update UserFace to latest approved
+                # Update UserFace to latest approved first, so pruning protects it
                 from .models import UserFace
                 UserFace.objects.update_or_create(
                     user=user,
-                    defaults={"face_image": f"faces/{user.username}/{user.username}_{next_index}.jpg"}
+                    defaults={"face_image": relative_path(dest_path)}
                 )
+                add_user_embedding(user.username, dest_path)
+                notify_gallery_change(user.username, "admin_approval")
     
                 # Mark request as approved
                 obj.status = "Approved"
@@ -596,4 +605,36 @@ class UserFaceAdmin(admin.ModelAdmin):
     face_status.short_description = "Status"
 
 # Register the UserFace admin
-custom_admin_site.register(UserFace, UserFaceAdmin)
\ No newline at end of file
+custom_admin_site.register(UserFace, UserFaceAdmin)
+class ClassRosterAdmin(admin.ModelAdmin):
+    list_display = ("name", "faculty", "student_count", "created_at")
+    search_fields = ("name", "faculty__username")
+    filter_horizontal = ("students",)
+
+    def student_count(self, obj):
+        return obj.students.count()
+    student_count.short_description = "Students"
+
+custom_admin_site.register(ClassRoster, ClassRosterAdmin)
+
+class FaceTemplateAdmin(admin.ModelAdmin):
+    list_display = ("username", "image_path", "sequence", "source", "created_at")
+    search_fields = ("username", "image_path")
+    list_filter = ("source",)
+    readonly_fields = ("content_hash", "embedding_key", "created_at")
+
+custom_admin_site.register(FaceTemplate, FaceTemplateAdmin)
+
+class AttendanceEventAdmin(admin.ModelAdmin):
+    list_display = ("user", "timestamp", "kind", "device", "distance", "projected")
+    search_fields = ("user__username",)
+    list_filter = ("kind", "device", "projected")
+
+    # The log is append-only
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+custom_admin_site.register(AttendanceEvent, AttendanceEventAdmin)
@@ -1,3 +1,4 @@
+import os
 from django.apps import AppConfig
     
 class AccountsConfig(AppConfig):
@@ -6,4 +7,18 @@ class AccountsConfig(AppConfig):
 
     def ready(self):
         import accounts.signal
+
+        from .recognition_pool import POOL_WORKER_ENV
+        if os.environ.get(POOL_WORKER_ENV):
+            # A recognition pool process: it only runs jobs handed to it
+            return
+
+        from django.conf import settings
+        if settings.FACE_MODEL_WARMUP and not settings.FACE_SERVICE_SOCKET:
+            if settings.FACE_EXECUTOR == "process":
+                from .recognition_pool import start_pool
+                start_pool()
+            else:
+                from .face_models import start_background_warmup
+                start_background_warmup()
         
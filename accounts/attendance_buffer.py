@@ -0,0 +1,275 @@
+import atexit
+import json
+import os
+import threading
+from datetime import datetime
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .attendance_log import day_events, local_datetime, project_pending
+from .models import AttendanceEvent
+from .utils import amark_user_attendance, mark_user_attendance
+
+try:
+    import fcntl
+except ImportError:  # Windows dev servers run a single process
+    fcntl = None
+
+# -----------------------------
+# Write-behind Attendance Buffer
+# -----------------------------
+# During the morning rush every scan used to write synchronously, which
+# serializes on SQLite's write lock. With settings.ATTENDANCE_WRITE_BEHIND a
+# scan is appended (fsynced) to a journal and acknowledged; a background
+# thread inserts the journaled scans as AttendanceEvents with one bulk_create
+# every ATTENDANCE_FLUSH_EVENTS scans or ATTENDANCE_FLUSH_MS milliseconds and
+# projects them into Attendance.
+#
+# The journal is shared by every worker and split into JOURNAL_SHARDS files
+# by user id. A scan is decided while holding its shard's flock, against the
+# event log plus the shard's unflushed scans (scan_outcome's rule over the
+# whole log), so two workers can't both answer check_in. The flusher holds the
+# same flock while it moves a shard into the event log and empties it; a
+# shard a crashed worker left behind is simply flushed by the next one.
+# Flushing is idempotent: events are unique per (user, timestamp).
+JOURNAL_DIR = os.path.join(settings.MEDIA_ROOT, "attendance_journal")
+JOURNAL_SHARDS = 64
+
+
+def apply_scans(scans):
+    """
+    Inserts journaled scans ({"user_id", "timestamp", "device", "distance"})
+    as scan events in one statement, skipping ones already inserted.
+    Returns the number of scans.
+    """
+    if not scans:
+        return 0
+
+    AttendanceEvent.objects.bulk_create(
+        [
+            AttendanceEvent(
+                user_id=scan["user_id"],
+                kind="scan",
+                timestamp=datetime.fromisoformat(scan["timestamp"]),
+                device=scan.get("device", "web"),
+                distance=scan.get("distance"),
+            )
+            for scan in scans
+        ],
+        ignore_conflicts=True,
+    )
+    return len(scans)
+
+
+def _parse_journal(content):
+    scans = []
+    for line in content.splitlines():
+        try:
+            scans.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue  # torn line from a crash mid-append
+    return scans
+
+
+def _lock_shard(journal):
+    if fcntl is not None:
+        fcntl.flock(journal, fcntl.LOCK_EX)
+
+
+def _unlock_shard(journal):
+    if fcntl is not None:
+        fcntl.flock(journal, fcntl.LOCK_UN)
+
+
+class AttendanceBuffer:
+    def __init__(self, journal_dir=JOURNAL_DIR, flush_events=200, flush_ms=500):
+        self.journal_dir = journal_dir
+        self.flush_events = flush_events
+        self.flush_interval = flush_ms / 1000.0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # flock only excludes other processes reliably; threads also take these
+        self._shard_locks = [threading.Lock() for _ in range(JOURNAL_SHARDS)]
+        self._wakeup = threading.Event()
+        self._since_flush = 0
+        self._thread = None
+        self.stats = {"buffered": 0, "flushed": 0, "batches": 0, "replayed": 0, "errors": 0}
+        os.makedirs(journal_dir, exist_ok=True)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="attendance-flusher", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _shard_path(self, number):
+        return os.path.join(self.journal_dir, f"shard-{number}.jsonl")
+
+    # -----------------------------
+    # Scans
+    # -----------------------------
+    def record(self, user, device="web", distance=None):
+        """
+        Same contract as utils.mark_user_attendance, but the write is buffered.
+        Returns (action, time string or None, check_in time).
+        """
+        stamp = timezone.now()
+        now = local_datetime(stamp)
+        number = user.id % JOURNAL_SHARDS
+
+        with open(self._shard_path(number), "a+") as journal:
+            with self._shard_locks[number]:
+                _lock_shard(journal)
+                try:
+                    journal.seek(0)
+                    content = journal.read()
+                    pending = [
+                        datetime.fromisoformat(scan["timestamp"])
+                        for scan in _parse_journal(content)
+                        if scan["user_id"] == user.id
+                    ]
+                    firsts = list(day_events(user.id, now.date()).values_list("timestamp", flat=True)[:2])
+                    firsts += [at for at in pending if local_datetime(at).date() == now.date()]
+                    if len(firsts) >= 2:
+                        return "completed", None, local_datetime(firsts[0]).time()
+
+                    scan = {"user_id": user.id, "timestamp": stamp.isoformat(), "device": device, "distance": distance}
+                    # Never glue onto a line torn by a crash
+                    journal.write(("\n" if content and not content.endswith("\n") else "") + json.dumps(scan) + "\n")
+                    journal.flush()
+                finally:
+                    _unlock_shard(journal)
+
+            # Other scans on this shard needn't wait for the disk
+            os.fsync(journal.fileno())
+
+        with self._lock:
+            self.stats["buffered"] += 1
+            self._since_flush += 1
+            if self._since_flush >= self.flush_events:
+                self._wakeup.set()
+
+        if firsts:
+            return "check_out", now.strftime("%H:%M:%S"), local_datetime(firsts[0]).time()
+        return "check_in", now.strftime("%H:%M:%S"), now.time()
+
+    # -----------------------------
+    # Flushing
+    # -----------------------------
+    def flush(self):
+        """
+        Moves every shard's scans into the event log and empties the shard,
+        then projects them. A failed insert leaves the shard as it was for the
+        next cycle. Returns the number of scans flushed.
+        """
+        with self._flush_lock:
+            with self._lock:
+                self._since_flush = 0
+
+            flushed = 0
+            for number in range(JOURNAL_SHARDS):
+                path = self._shard_path(number)
+                try:
+                    if not os.path.getsize(path):
+                        continue
+                except FileNotFoundError:
+                    continue
+
+                with open(path, "a+") as journal:
+                    with self._shard_locks[number]:
+                        _lock_shard(journal)
+                        try:
+                            journal.seek(0)
+                            scans = _parse_journal(journal.read())
+                            apply_scans(scans)
+                            journal.truncate(0)
+                        finally:
+                            _unlock_shard(journal)
+
+                flushed += len(scans)
+                self.stats["flushed"] += len(scans)
+                self.stats["batches"] += 1
+
+            if flushed:
+                project_pending()
+            return flushed
+
+    def _run(self):
+        try:
+            # Whatever a crashed worker journaled but never flushed
+            replayed = self.flush()
+            if replayed:
+                print(f"[Attendance Buffer] Replayed {replayed} journaled scan(s)")
+            self.stats["replayed"] += replayed
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"[Attendance Buffer] Replay failed, will retry: {e}")
+
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"[Attendance Buffer] Flush failed, will retry: {e}")
+
+    def status(self):
+        pending = 0
+        for number in range(JOURNAL_SHARDS):
+            try:
+                with open(self._shard_path(number)) as journal:
+                    pending += len(_parse_journal(journal.read()))
+            except FileNotFoundError:
+                continue
+        return {"enabled": True, "pending": pending, **self.stats}
+
+
+# -----------------------------
+# Process-wide Buffer
+# -----------------------------
+# Started by the first scan (or health check), so manage.py commands and
+# recognition pool processes never run a flusher
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_attendance_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = AttendanceBuffer(
+                flush_events=settings.ATTENDANCE_FLUSH_EVENTS,
+                flush_ms=settings.ATTENDANCE_FLUSH_MS,
+            )
+            _buffer.start()
+        return _buffer
+
+
+def record_scan(user, device="web", distance=None):
+    """
+    Entry point for every recognized scan: buffered when
+    settings.ATTENDANCE_WRITE_BEHIND is on, else inserted right away.
+    """
+    if settings.ATTENDANCE_WRITE_BEHIND:
+        return get_attendance_buffer().record(user, device=device, distance=distance)
+    return mark_user_attendance(user, device=device, distance=distance)
+
+
+async def arecord_scan(user, device="web", distance=None):
+    """
+    record_scan for async views; both paths run their (short) database work
+    in a worker thread.
+    """
+    if settings.ATTENDANCE_WRITE_BEHIND:
+        return await sync_to_async(get_attendance_buffer().record)(user, device=device, distance=distance)
+    return await amark_user_attendance(user, device=device, distance=distance)
+
+
+def buffer_status():
+    if not settings.ATTENDANCE_WRITE_BEHIND:
+        return {"enabled": False}
+    return get_attendance_buffer().status()
@@ -0,0 +1,159 @@
+import threading
+from datetime import datetime, time
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Attendance, AttendanceEvent
+
+# -----------------------------
+# Attendance Event Log
+# -----------------------------
+# Every scan is one INSERT into AttendanceEvent. Attendance rows (what the
+# reports read) are a daily projection of the log, folded in incrementally by
+# project_pending: from a background thread in each process that records
+# events, and at the top of every view (user or admin) that reads Attendance.
+
+
+def local_datetime(timestamp):
+    # Attendance dates/times follow the server clock (datetime.now()), like the rest of the app
+    return datetime.fromtimestamp(timestamp.timestamp())
+
+
+def record_event(user, kind="scan", device="web", distance=None, timestamp=None):
+    """
+    The hot path: appends one event and nothing else.
+    """
+    event = AttendanceEvent.objects.create(
+        user=user,
+        kind=kind,
+        device=device,
+        distance=distance,
+        timestamp=timestamp or timezone.now(),
+    )
+    _ensure_projector()
+    return event
+
+
+def day_events(user_id, day):
+    """
+    The user's events from the start of a (server-local) day, in log order.
+    """
+    day_start = datetime.combine(day, time.min).astimezone()
+    return AttendanceEvent.objects.filter(user_id=user_id, timestamp__gte=day_start).order_by("id")
+
+
+def scan_outcome(event):
+    """
+    What a scan means, read back from the log (not the projection):
+    the day's first event checks in, the second checks out.
+    Only sound while the user's scans are serialized (see
+    utils.mark_user_attendance): ids are not assigned in commit order.
+    Returns (action, time string or None, check_in time).
+    """
+    now = local_datetime(event.timestamp)
+    firsts = list(day_events(event.user_id, now.date()).filter(id__lte=event.id).values_list("id", "timestamp")[:2])
+    check_in = local_datetime(firsts[0][1]).time()
+    ids = [event_id for event_id, _ in firsts]
+    if event.id not in ids:
+        return "completed", None, check_in
+    action = "check_in" if ids.index(event.id) == 0 else "check_out"
+    return action, now.strftime("%H:%M:%S"), check_in
+
+
+# -----------------------------
+# Daily Projection
+# -----------------------------
+def _fold(attendance, event, at):
+    """
+    Applies one event to a day's row. Returns True if the row changed.
+    """
+    if at in (attendance.check_in, attendance.check_out):
+        return False
+    if event.kind in ("scan", "check_in") and attendance.check_in is None:
+        attendance.check_in = at
+        attendance.status = "Checked In"
+        return True
+    if event.kind in ("scan", "check_out") and attendance.check_in is not None \
+            and attendance.check_out is None and at > attendance.check_in:
+        attendance.check_out = at
+        attendance.status = "Present"
+        return True
+    return False
+
+
+def project_pending(limit=5000):
+    """
+    Folds unprojected events into Attendance, in id order, with one
+    bulk_create + one bulk_update, and marks them projected in the same
+    transaction (so each event is applied exactly once). Returns the number
+    of events consumed.
+    """
+    # Read-only page views land here too: don't take the write lock for nothing
+    if not AttendanceEvent.objects.filter(projected=False).exists():
+        return 0
+
+    try:
+        return _project_batch(limit)
+    except IntegrityError:
+        # e.g. an Absent row created meanwhile rolls the batch back; the next pass updates it instead
+        return 0
+
+
+def _project_batch(limit):
+    with transaction.atomic():
+        events = list(
+            AttendanceEvent.objects.select_for_update().filter(projected=False).order_by("id")[:limit]
+        )
+        if not events:
+            return 0
+
+        stamped = [(event, local_datetime(event.timestamp)) for event in events]
+        rows = {
+            (attendance.user_id, attendance.date): attendance
+            for attendance in Attendance.objects.select_for_update().filter(
+                user_id__in={event.user_id for event in events},
+                date__in={at.date() for _, at in stamped},
+            )
+        }
+        created, updated = {}, {}
+        for event, at in stamped:
+            key = (event.user_id, at.date())
+            attendance = rows.get(key) or created.get(key)
+            if attendance is None:
+                attendance = created[key] = Attendance(user_id=key[0], date=key[1])
+            if _fold(attendance, event, at.time()) and key in rows:
+                updated[key] = attendance
+
+        Attendance.objects.bulk_create([row for row in created.values() if row.check_in is not None])
+        Attendance.objects.bulk_update(updated.values(), ["check_in", "check_out", "status"])
+        AttendanceEvent.objects.filter(id__in=[event.id for event in events]).update(projected=True)
+    return len(events)
+
+
+# -----------------------------
+# Background Projector
+# -----------------------------
+_projector = {"thread": None}
+_projector_lock = threading.Lock()
+
+
+def _project_forever():
+    wakeup = threading.Event()
+    while True:
+        wakeup.wait(settings.ATTENDANCE_PROJECTION_MS / 1000.0)
+        try:
+            close_old_connections()
+            while project_pending() >= 5000:
+                pass
+        except Exception as e:
+            print(f"[Attendance Log] Projection failed, will retry: {e}")
+
+
+def _ensure_projector():
+    if settings.ATTENDANCE_PROJECTION_MS <= 0:
+        return
+    with _projector_lock:
+        if _projector["thread"] is None:
+            _projector["thread"] = threading.Thread(target=_project_forever, name="attendance-projector", daemon=True)
+            _projector["thread"].start()
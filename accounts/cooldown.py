@@ -0,0 +1,69 @@
+import threading
+from django.conf import settings
+from django.core.cache import cache
+
+# -----------------------------
+# Re-recognition Cooldown
+# -----------------------------
+# After a successful scan, the same user (on the same kiosk device) gets the
+# previous result back for settings.FACE_COOLDOWN_SECONDS: no model run and no
+# attendance write, so repeated Verify clicks cannot flip check-in into
+# check-out. Entries live in Django's cache; configure a shared CACHES backend
+# to apply the window across web workers.
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stored": 0}
+
+
+def _key(username, device):
+    return f"face-cooldown:{device or 'web'}:{username}"
+
+
+def get_recent_result(username, device=None):
+    """
+    The result recorded for this user (and device) inside the window, or None.
+    """
+    if settings.FACE_COOLDOWN_SECONDS <= 0:
+        return None
+
+    result = cache.get(_key(username, device))
+    with _lock:
+        _stats["hits" if result is not None else "misses"] += 1
+    return result
+
+
+def remember_result(username, result, device=None):
+    if settings.FACE_COOLDOWN_SECONDS <= 0:
+        return
+    cache.set(_key(username, device), result, timeout=settings.FACE_COOLDOWN_SECONDS)
+    with _lock:
+        _stats["stored"] += 1
+
+
+async def aget_recent_result(username, device=None):
+    if settings.FACE_COOLDOWN_SECONDS <= 0:
+        return None
+
+    result = await cache.aget(_key(username, device))
+    with _lock:
+        _stats["hits" if result is not None else "misses"] += 1
+    return result
+
+
+async def aremember_result(username, result, device=None):
+    if settings.FACE_COOLDOWN_SECONDS <= 0:
+        return
+    await cache.aset(_key(username, device), result, timeout=settings.FACE_COOLDOWN_SECONDS)
+    with _lock:
+        _stats["stored"] += 1
+
+
+def cooldown_stats():
+    """
+    Hit rate of the cooldown in this process, for the health endpoint.
+    """
+    with _lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+    stats["window_seconds"] = settings.FACE_COOLDOWN_SECONDS
+    return stats
@@ -0,0 +1,100 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+# -----------------------------
+# Paths
+# -----------------------------
+CACHE_DB = os.path.join(settings.MEDIA_ROOT, "embedding_cache")
+
+
+def file_sha256(path):
+    """
+    Content hash of an image file; identical bytes always map to one embedding.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# -----------------------------
+# Two-tier Embedding Cache
+# -----------------------------
+class EmbeddingCache:
+    """
+    Embeddings keyed by (content hash, model, detector). A bounded in-memory
+    LRU sits in front of one .npy file per key on disk, so an image whose
+    bytes have not changed is never embedded twice, even across restarts.
+    A rewritten file gets a new hash and therefore a new key.
+    """
+
+    def __init__(self, directory, max_entries=2048):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def _disk_path(self, content_hash, model, detector):
+        return os.path.join(self.directory, f"{model}-{detector}", content_hash[:2], f"{content_hash}.npy")
+
+    def reference(self, content_hash, model, detector):
+        """
+        Location of the entry relative to the cache directory, recorded in the
+        face catalogue (FaceTemplate.embedding_key).
+        """
+        return os.path.relpath(self._disk_path(content_hash, model, detector), self.directory).replace("\\", "/")
+
+    def get(self, content_hash, model, detector):
+        key = (content_hash, model, detector)
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return self.memory[key]
+
+        path = self._disk_path(content_hash, model, detector)
+        try:
+            vector = np.load(path)
+        except (OSError, ValueError):
+            with self.lock:
+                self.stats["misses"] += 1
+            return None
+
+        with self.lock:
+            self.stats["disk_hits"] += 1
+        self._remember(key, vector)
+        return vector
+
+    def put(self, content_hash, model, detector, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        path = self._disk_path(content_hash, model, detector)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, vector)
+        os.replace(tmp_path, path)
+        self._remember((content_hash, model, detector), vector)
+
+    def _remember(self, key, vector):
+        with self.lock:
+            self.memory[key] = vector
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_entries:
+                self.memory.popitem(last=False)
+
+
+_cache = None
+
+
+def get_embedding_cache():
+    global _cache
+    if _cache is None:
+        _cache = EmbeddingCache(CACHE_DB, max_entries=settings.FACE_EMBEDDING_CACHE_SIZE)
+    return _cache
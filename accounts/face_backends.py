@@ -0,0 +1,145 @@
+import os
+import threading
+import cv2
+import numpy as np
+from django.conf import settings
+
+# -----------------------------
+# Facenet Input Spec
+# -----------------------------
+FACENET_INPUT_SIZE = (160, 160)
+FACENET_DIMENSIONS = 128
+
+
+def letterbox_face(face, target_size=FACENET_INPUT_SIZE):
+    """
+    Resizes a detected BGR crop to target_size keeping the aspect ratio and
+    padding with black, exactly as DeepFace does before inference. A crop
+    that is already target_size passes through unchanged.
+    """
+    factor = min(target_size[0] / face.shape[0], target_size[1] / face.shape[1])
+    face = cv2.resize(face, (int(face.shape[1] * factor), int(face.shape[0] * factor)))
+
+    diff_0 = target_size[0] - face.shape[0]
+    diff_1 = target_size[1] - face.shape[1]
+    face = np.pad(
+        face,
+        ((diff_0 // 2, diff_0 - diff_0 // 2), (diff_1 // 2, diff_1 - diff_1 // 2), (0, 0)),
+        "constant",
+    )
+    if face.shape[0:2] != target_size:
+        face = cv2.resize(face, target_size)
+    return face
+
+
+def preprocess_face(face, target_size=FACENET_INPUT_SIZE):
+    """
+    Same steps DeepFace.represent applies to a detected BGR crop: letterbox
+    to target_size, scale to [0, 1] and keep BGR channel order ("base"
+    normalization). Returns a (1, H, W, 3) float32 array.
+    """
+    face = letterbox_face(face, target_size).astype(np.float32)[np.newaxis, ...]
+    if face.max() > 1:
+        face /= 255.0
+    return face
+
+
+# -----------------------------
+# Inference Backends
+# -----------------------------
+# A backend turns detected BGR face crops into Facenet embeddings. Detection
+# still runs through DeepFace's detectors; only the embedding model is swapped.
+class DeepFaceBackend:
+    """
+    Facenet on TensorFlow through DeepFace (the reference implementation).
+    """
+
+    name = "deepface"
+
+    def load(self):
+        from deepface.modules import modeling
+        from .face_embeddings import MODEL_NAME
+
+        modeling.build_model(task="facial_recognition", model_name=MODEL_NAME)
+
+    def embed(self, faces):
+        from deepface import DeepFace
+        from .face_embeddings import MODEL_NAME
+
+        results = DeepFace.represent(list(faces), model_name=MODEL_NAME, detector_backend="skip")
+        if len(faces) == 1:
+            results = [results]
+        return np.asarray([faces_in_image[0]["embedding"] for faces_in_image in results], dtype=np.float32)
+
+
+class OnnxFacenetBackend:
+    """
+    Facenet exported to ONNX (manage.py export_facenet_onnx) and run on
+    ONNX Runtime's CPU provider, without importing TensorFlow.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path, threads=0):
+        self.model_path = model_path
+        self.threads = threads
+        self.session = None
+        self.input_name = None
+        self.channels_first = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            if self.session is not None:
+                return
+            if not os.path.exists(self.model_path):
+                raise FileNotFoundError(f"ONNX Facenet model not found: {self.model_path}")
+
+            import onnxruntime
+
+            options = onnxruntime.SessionOptions()
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if self.threads:
+                options.intra_op_num_threads = self.threads
+            session = onnxruntime.InferenceSession(
+                self.model_path, sess_options=options, providers=["CPUExecutionProvider"]
+            )
+
+            model_input = session.get_inputs()[0]
+            self.input_name = model_input.name
+            # Keras exports are NHWC; a PyTorch-style export is NCHW
+            self.channels_first = model_input.shape[1] == 3
+            self.session = session
+
+    def embed(self, faces):
+        self.load()
+        batch = np.concatenate([preprocess_face(face) for face in faces], axis=0)
+        if self.channels_first:
+            batch = batch.transpose(0, 3, 1, 2)
+        embeddings = self.session.run(None, {self.input_name: np.ascontiguousarray(batch)})[0]
+        return np.asarray(embeddings, dtype=np.float32).reshape(len(faces), FACENET_DIMENSIONS)
+
+
+BACKEND_NAMES = ("deepface", "onnx")
+
+
+def build_backend(name):
+    if name == "deepface":
+        return DeepFaceBackend()
+    if name == "onnx":
+        return OnnxFacenetBackend(settings.FACE_ONNX_MODEL_PATH, threads=settings.FACE_ONNX_THREADS)
+    raise ValueError(f"Unknown face inference backend: {name}")
+
+
+_backend = None
+
+
+def get_backend():
+    """
+    The process-wide backend selected by settings.FACE_INFERENCE_BACKEND.
+    Nothing heavy is imported until load() or embed() is called.
+    """
+    global _backend
+    if _backend is None:
+        _backend = build_backend(settings.FACE_INFERENCE_BACKEND)
+    return _backend
@@ -0,0 +1,514 @@
+import os
+import cv2
+import numpy as np
+from django.conf import settings
+from .embedding_cache import file_sha256, get_embedding_cache
+from .face_backends import get_backend, letterbox_face
+from .face_models import ensure_loaded
+from .face_templates import (
+    delete_template,
+    referenced_template_names,
+    set_content_hash,
+    set_embedding_key,
+    template_files,
+)
+
+# -----------------------------
+# Paths & Model Config
+# -----------------------------
+FACE_DB = os.path.join(settings.MEDIA_ROOT, "faces")
+EMBEDDINGS_DB = os.path.join(settings.MEDIA_ROOT, "embeddings")
+os.makedirs(EMBEDDINGS_DB, exist_ok=True)
+# Aligned 160x160 crops of stored images, keyed by detector and content hash
+CROPS_DB = os.path.join(settings.MEDIA_ROOT, "face_crops")
+
+MODEL_NAME = "Facenet"
+DETECTOR_BACKEND = "mtcnn"
+
+# DeepFace.verify marks a Facenet pair as "verified" below this cosine distance
+MATCH_THRESHOLD = 0.40
+
+
+# -----------------------------
+# Compute Embedding
+# -----------------------------
+# DeepFace (and TensorFlow) is imported lazily so web workers that talk to the
+# recognition service (settings.FACE_SERVICE_SOCKET) never load it.
+def _uses_service():
+    return bool(settings.FACE_SERVICE_SOCKET)
+
+
+def represent_face(img):
+    """
+    Runs detection + Facenet once and returns the embedding of the largest face.
+    img = image path or OpenCV frame (BGR)
+    """
+    if _uses_service():
+        from .face_service import remote_represent
+        return remote_represent(img, mode="enroll")[0]
+
+    ensure_loaded()
+    face, _ = detect_face(img, cascade=[DETECTOR_BACKEND])
+    return embed_faces([face])[0]
+
+
+def embed_faces(faces):
+    """
+    One batched Facenet forward pass over already-detected face crops (BGR),
+    on the backend chosen by settings.FACE_INFERENCE_BACKEND.
+    Returns an (N, 128) float32 matrix.
+    """
+    return get_backend().embed(faces)
+
+
+# -----------------------------
+# Live Frame Detector Cascade
+# -----------------------------
+def _is_prealigned_crop(img):
+    """
+    True when the frame already looks like the square, centred face box that
+    face_scan.html sends, so running a detector on it can be skipped.
+    """
+    height, width = img.shape[:2]
+    aspect = max(height, width) / max(min(height, width), 1)
+    return (
+        settings.FACE_SKIP_MIN_SIDE <= min(height, width)
+        and max(height, width) <= settings.FACE_SKIP_MAX_SIDE
+        and aspect <= settings.FACE_SKIP_MAX_ASPECT
+    )
+
+
+def detect_face(img, cascade=None):
+    """
+    Tries each detector in settings.FACE_DETECTOR_CASCADE (cheapest first) and
+    returns (face_crop_bgr, stage) from the first stage that finds a face.
+    The "skip" stage accepts the frame as-is when it passes the crop rules.
+    """
+    from deepface import DeepFace
+
+    for stage in cascade or settings.FACE_DETECTOR_CASCADE:
+        if stage == "skip":
+            if _is_prealigned_crop(img):
+                return img, stage
+            continue
+
+        try:
+            faces = DeepFace.extract_faces(
+                img,
+                detector_backend=stage,
+                enforce_detection=True,
+                align=True,
+                color_face="bgr",
+                normalize_face=False,
+            )
+        except ValueError:
+            continue
+
+        largest = max(faces, key=lambda face: face["facial_area"]["w"] * face["facial_area"]["h"])
+        return largest["face"], stage
+
+    raise ValueError("Face could not be detected by any detector in the cascade.")
+
+
+def represent_live_face(img):
+    """
+    Embeds a live frame using the detector cascade.
+    Returns (embedding, stage) where stage names the detector that found the face.
+    """
+    if _uses_service():
+        from .face_service import remote_represent
+        return remote_represent(img, mode="live")
+
+    ensure_loaded()
+    face, stage = detect_face(img)
+    return embed_faces([face])[0], stage
+
+
+# -----------------------------
+# Aligned Crops of Stored Images
+# -----------------------------
+# A stored image is detected and aligned once, at enrollment; the 160x160
+# crop is kept (lossless PNG) next to the embedding cache so re-embedding it
+# later (new model, cleared cache) needs no detector. Cropping to the model
+# input size is the same letterbox the backend would apply, so embeddings of
+# the crop equal embeddings of the detected face.
+def align_face(img):
+    """
+    Reference-detector crop of the largest face, letterboxed to 160x160 BGR.
+    """
+    ensure_loaded()
+    face, _ = detect_face(img, cascade=[DETECTOR_BACKEND])
+    return letterbox_face(np.asarray(face, dtype=np.uint8))
+
+
+def _crop_path(content_hash):
+    return os.path.join(CROPS_DB, DETECTOR_BACKEND, content_hash[:2], f"{content_hash}.png")
+
+
+def load_face_crop(content_hash):
+    return cv2.imread(_crop_path(content_hash)) if os.path.exists(_crop_path(content_hash)) else None
+
+
+def save_face_crop(content_hash, crop):
+    path = _crop_path(content_hash)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp.png"
+    cv2.imwrite(tmp_path, crop)
+    os.replace(tmp_path, path)
+
+
+def represent_crop(crop):
+    """
+    Embedding of an aligned crop; skips detection entirely.
+    """
+    if _uses_service():
+        from .face_service import remote_represent
+        return remote_represent(crop, mode="aligned")[0]
+
+    ensure_loaded()
+    return embed_faces([crop])[0]
+
+
+def stored_face_crop(img_path, content_hash, img=None):
+    """
+    The aligned crop of a stored image, detecting only if it was never cropped.
+    """
+    crop = load_face_crop(content_hash)
+    if crop is None:
+        source = img if img is not None else img_path
+        if _uses_service():
+            from .face_service import remote_align
+            crop = remote_align(source)
+        else:
+            crop = align_face(source)
+        save_face_crop(content_hash, crop)
+    return crop
+
+
+# -----------------------------
+# Multi-face Photos
+# -----------------------------
+def detect_all_faces(img):
+    """
+    Every face the reference detector finds in a group photo.
+    Returns (face_crops_bgr, facial_areas), largest face first.
+    """
+    from deepface import DeepFace
+
+    faces = DeepFace.extract_faces(
+        img,
+        detector_backend=DETECTOR_BACKEND,
+        enforce_detection=False,
+        align=True,
+        color_face="bgr",
+        normalize_face=False,
+    )
+    # Without enforce_detection DeepFace returns the whole image (confidence 0) when nothing is found
+    faces = [face for face in faces if face.get("confidence", 0) > 0]
+    faces.sort(key=lambda face: face["facial_area"]["w"] * face["facial_area"]["h"], reverse=True)
+    areas = [{k: int(face["facial_area"][k]) for k in ("x", "y", "w", "h")} for face in faces]
+    return [face["face"] for face in faces], areas
+
+
+def represent_all_faces(img):
+    """
+    One detection pass and one batched embedding call for a group photo.
+    Returns (vectors, facial_areas) with vectors shaped (N, 128).
+    """
+    if _uses_service():
+        from .face_service import remote_represent_all
+        return remote_represent_all(img)
+
+    ensure_loaded()
+    faces, areas = detect_all_faces(img)
+    if not faces:
+        return np.empty((0, 0), dtype=np.float32), []
+    return embed_faces(faces), areas
+
+
+def cosine_distances(vector, matrix):
+    """
+    Cosine distance between one embedding and every row of a matrix.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    vector = np.asarray(vector, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(vector)
+    norms[norms == 0] = 1e-10
+    return 1.0 - (matrix @ vector) / norms
+
+
+# -----------------------------
+# Per-user Embedding Store
+# -----------------------------
+# Each user's store records, per approved image: name, content hash, size and
+# mtime, plus the embedding, and the user's centroid (mean of the unit
+# vectors). Vectors come from the content-hash cache, so an image is only
+# embedded when its bytes are new.
+def _store_path(username):
+    return os.path.join(EMBEDDINGS_DB, f"{username}.npz")
+
+
+def _empty_store():
+    return {
+        "names": [],
+        "hashes": [],
+        "stamps": [],
+        "vectors": np.empty((0, 0), dtype=np.float32),
+        "centroid": np.empty(0, dtype=np.float32),
+    }
+
+
+def _centroid(vectors):
+    if len(vectors) == 0:
+        return np.empty(0, dtype=np.float32)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    mean = (vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-10)).mean(axis=0)
+    return (mean / max(float(np.linalg.norm(mean)), 1e-10)).astype(np.float32)
+
+
+def _load_store(username):
+    path = _store_path(username)
+    if not os.path.exists(path):
+        return _empty_store()
+
+    with np.load(path) as data:
+        names = [str(name) for name in data["names"]]
+        store = {"names": names, "vectors": data["vectors"].astype(np.float32)}
+        if "hashes" in data.files:
+            store["hashes"] = [str(h) for h in data["hashes"]]
+            store["stamps"] = list(zip(data["sizes"].tolist(), data["mtimes"].tolist()))
+        else:
+            # Stores written before the cache existed: vectors are valid, metadata is not
+            store["hashes"] = [""] * len(names)
+            store["stamps"] = [(-1, -1)] * len(names)
+        store["centroid"] = data["centroid"].astype(np.float32) if "centroid" in data.files else _centroid(store["vectors"])
+    return store
+
+
+def _save_store(username, store):
+    """
+    Writes the user's store atomically so readers never see a partial file.
+    """
+    path = _store_path(username)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    sizes = [stamp[0] for stamp in store["stamps"]]
+    mtimes = [stamp[1] for stamp in store["stamps"]]
+    store["centroid"] = _centroid(store["vectors"])
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            names=np.asarray(store["names"], dtype=str),
+            hashes=np.asarray(store["hashes"], dtype=str),
+            sizes=np.asarray(sizes, dtype=np.int64),
+            mtimes=np.asarray(mtimes, dtype=np.int64),
+            vectors=np.asarray(store["vectors"], dtype=np.float32),
+            centroid=store["centroid"],
+        )
+    os.replace(tmp_path, path)
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def embed_stored_image(img_path, img=None, content_hash=None):
+    """
+    Embedding of a stored face image, served from the content-hash cache when
+    the same bytes were embedded before, else from its aligned crop (detected
+    once, at enrollment). img = already-decoded pixels of the file.
+    """
+    cache = get_embedding_cache()
+    content_hash = content_hash or file_sha256(img_path)
+    vector = cache.get(content_hash, MODEL_NAME, DETECTOR_BACKEND)
+    if vector is None:
+        vector = represent_crop(stored_face_crop(img_path, content_hash, img=img))
+        cache.put(content_hash, MODEL_NAME, DETECTOR_BACKEND, vector)
+    return vector, content_hash
+
+
+def _upsert(store, img_name, content_hash, stamp, vector):
+    if img_name in store["names"]:
+        i = store["names"].index(img_name)
+        store["hashes"][i] = content_hash
+        store["stamps"][i] = stamp
+        store["vectors"][i] = vector
+        return
+
+    store["names"].append(img_name)
+    store["hashes"].append(content_hash)
+    store["stamps"].append(stamp)
+    vectors = store["vectors"]
+    store["vectors"] = np.vstack([vectors, vector]) if len(vectors) else vector[np.newaxis, :]
+
+
+def _drop(store, img_names):
+    keep = [i for i, name in enumerate(store["names"]) if name not in img_names]
+    store["names"] = [store["names"][i] for i in keep]
+    store["hashes"] = [store["hashes"][i] for i in keep]
+    store["stamps"] = [store["stamps"][i] for i in keep]
+    store["vectors"] = store["vectors"][keep] if keep else np.empty((0, 0), dtype=np.float32)
+
+
+def _prune_store(username, store, keep=()):
+    """
+    Caps the user's templates at settings.FACE_MAX_TEMPLATES_PER_USER by
+    repeatedly dropping the most redundant one (highest similarity to its
+    nearest other template), so the kept set spans the most appearance
+    variation rather than the most recent captures. Images in keep (e.g. the
+    one just added) are never dropped. Pruned images are removed from the
+    catalogue and disk. Returns the pruned names.
+    """
+    cap = settings.FACE_MAX_TEMPLATES_PER_USER
+    if cap <= 0 or len(store["names"]) <= cap:
+        return []
+
+    unit = store["vectors"] / np.maximum(np.linalg.norm(store["vectors"], axis=1, keepdims=True), 1e-10)
+    similarity = unit @ unit.T
+    np.fill_diagonal(similarity, -np.inf)
+    protected = referenced_template_names(username) | set(keep)
+    alive = list(range(len(store["names"])))
+    pruned = []
+    while len(alive) > cap:
+        candidates = [i for i in alive if store["names"][i] not in protected]
+        if not candidates:
+            break
+        redundancy = similarity[np.ix_(candidates, alive)].max(axis=1)
+        victim = candidates[int(np.argmax(redundancy))]
+        alive.remove(victim)
+        pruned.append(store["names"][victim])
+
+    templates = template_files(username)
+    for img_name in pruned:
+        if img_name in templates:
+            delete_template(templates[img_name][0])
+    _drop(store, set(pruned))
+    print(f"[Embedding] Pruned {len(pruned)} redundant template(s) for user: {username}: {pruned}")
+    return pruned
+
+
+def load_user_embeddings(username):
+    """
+    Returns (image_names, vectors) stored for a user, or empty values if none.
+    """
+    store = _load_store(username)
+    return store["names"], store["vectors"]
+
+
+def add_user_embedding(username, img_path, img=None):
+    """
+    Embeds a newly enrolled face image and adds (or replaces) it in the user's store.
+    Pass the already-decoded frame as img to skip reading img_path back from disk.
+    Returns the embedding, or None if no face could be embedded.
+    """
+    try:
+        vector, content_hash = embed_stored_image(img_path, img=img)
+    except Exception as e:
+        print(f"[Embedding Error] {img_path}: {e}")
+        return None
+
+    img_name = os.path.basename(img_path)
+    store = _load_store(username)
+    _upsert(store, img_name, content_hash, _file_stamp(img_path), vector)
+    _prune_store(username, store, keep={img_name})
+    _save_store(username, store)
+    set_embedding_key(img_path, get_embedding_cache().reference(content_hash, MODEL_NAME, DETECTOR_BACKEND))
+    print(f"[Embedding] Stored {img_name} for user: {username}")
+    return vector
+
+
+def remove_user_embedding(username, img_name):
+    """
+    Drops a single image's embedding, e.g. when the image itself was deleted.
+    """
+    store = _load_store(username)
+    if img_name not in store["names"]:
+        return
+
+    _drop(store, {img_name})
+    _save_store(username, store)
+
+
+def sync_user_embeddings(username, store=None):
+    """
+    Reconciles the user's store with their catalogued images (FaceTemplate):
+    removed images are dropped, images whose size or mtime changed are
+    re-hashed, and new or rewritten images (content hash changed) are
+    embedded only on a cache miss. Writes the store only if it changed.
+    """
+    store = store if store is not None else _load_store(username)
+    templates = template_files(username)
+
+    changed = False
+    removed = set(store["names"]) - set(templates)
+    if removed:
+        _drop(store, removed)
+        changed = True
+
+    cache = get_embedding_cache()
+    for img_file in sorted(templates):
+        db_img_path, content_hash = templates[img_file]
+        if img_file in store["names"]:
+            i = store["names"].index(img_file)
+            stamp = _file_stamp(db_img_path) if os.path.exists(db_img_path) else store["stamps"][i]
+            if stamp == store["stamps"][i] and store["hashes"][i]:
+                continue
+            if stamp != store["stamps"][i]:
+                # Touched since it was embedded (e.g. a rewritten <username>_new.jpg):
+                # the catalogued hash may be stale, the bytes decide
+                actual_hash = file_sha256(db_img_path)
+                if actual_hash != content_hash:
+                    set_content_hash(db_img_path, actual_hash)
+                    content_hash = actual_hash
+            if content_hash and store["hashes"][i] == content_hash:
+                _upsert(store, img_file, content_hash, stamp, store["vectors"][i])
+                changed = True
+                continue
+            if content_hash and store["hashes"][i] == "":
+                # Legacy entry: the vector is valid, adopt the file's hash and seed the cache
+                cache.put(content_hash, MODEL_NAME, DETECTOR_BACKEND, store["vectors"][i])
+                _upsert(store, img_file, content_hash, stamp, store["vectors"][i])
+                changed = True
+                continue
+
+        try:
+            vector, content_hash = embed_stored_image(db_img_path, content_hash=content_hash or None)
+            _upsert(store, img_file, content_hash, _file_stamp(db_img_path), vector)
+            set_embedding_key(db_img_path, cache.reference(content_hash, MODEL_NAME, DETECTOR_BACKEND))
+            changed = True
+        except Exception as e:
+            print(f"[Embedding Error] {db_img_path}: {e}")
+
+    if _prune_store(username, store):
+        changed = True
+
+    if changed or not os.path.exists(_store_path(username)):
+        _save_store(username, store)
+    return store["names"], store["vectors"]
+
+
+def rebuild_user_embeddings(username):
+    """
+    Rebuilds a user's store from every catalogued image of the user.
+    Unchanged images come back from the cache instead of being re-embedded.
+    """
+    names, vectors = sync_user_embeddings(username, store=_empty_store())
+    print(f"[Embedding] Rebuilt {len(names)} embedding(s) for user: {username}")
+    return names, vectors
+
+
+def get_user_embeddings(username):
+    """
+    Stored embeddings for a user, reconciled with the files on disk so that
+    rewritten or deleted images are picked up automatically.
+    """
+    return sync_user_embeddings(username)
+
+
+def get_user_gallery(username):
+    """
+    (names, vectors, centroid) for a user, reconciled like get_user_embeddings.
+    """
+    store = _load_store(username)
+    names, vectors = sync_user_embeddings(username, store=store)
+    return names, vectors, store["centroid"]
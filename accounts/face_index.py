@@ -0,0 +1,450 @@
+import json
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows dev servers run a single process
+    fcntl = None
+
+from .face_embeddings import get_user_embeddings
+from .face_templates import template_usernames
+from .models import GalleryEvent
+
+
+# -----------------------------
+# 1:N Face Index
+# -----------------------------
+class FaceIndex:
+    """
+    All enrolled embeddings held as one contiguous, L2-normalised float32 matrix.
+    A query is a single matrix-vector product (exact mode) or, with nlist > 0,
+    a product over the nprobe closest k-means partitions only (IVF mode).
+    """
+
+    def __init__(self, vectors, labels, nlist=0, nprobe=8, seed=0):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        # Rows carry an int32 id into a small table of usernames
+        names, ids = np.unique(np.asarray(labels, dtype=str), return_inverse=True)
+        self.names = [str(name) for name in names]
+        self.ids = ids.astype(np.int32)
+        self.matrix = np.ascontiguousarray(_normalize_rows(vectors))
+        self.nprobe = nprobe
+        self.centroids = None
+        self.offsets = None
+        self.version = 0
+        self.generation = 0
+
+        if nlist and len(self.ids) > nlist:
+            self._build_ivf(nlist, seed)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_store(cls, nlist=0, nprobe=8):
+        """
+        Builds the index from every user's persisted embeddings.
+        """
+        vectors, labels = [], []
+        for username in _enrolled_usernames():
+            names, user_vectors = get_user_embeddings(username)
+            if len(names):
+                vectors.append(user_vectors)
+                labels.extend([username] * len(names))
+
+        matrix = np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+        return cls(matrix, labels, nlist=nlist, nprobe=nprobe)
+
+    def _build_ivf(self, nlist, seed, iterations=10):
+        """
+        Partitions the gallery with spherical k-means and reorders the matrix
+        so each partition is a contiguous slice (no gather at query time).
+        """
+        rng = np.random.default_rng(seed)
+        centroids = self.matrix[rng.choice(len(self.matrix), nlist, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(self.matrix @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = self.matrix[assignment == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            centroids = _normalize_rows(centroids)
+
+        assignment = np.argmax(self.matrix @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        self.matrix = np.ascontiguousarray(self.matrix[order])
+        self.ids = self.ids[order]
+        self.centroids = np.ascontiguousarray(centroids)
+        self.offsets = np.searchsorted(assignment[order], np.arange(nlist + 1))
+
+    def _candidate_scores(self, query):
+        if self.centroids is None:
+            return np.arange(len(self.matrix)), self.matrix @ query
+
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in probes])
+        scores = np.concatenate([self.matrix[self.offsets[c]:self.offsets[c + 1]] @ query for c in probes])
+        return rows, scores
+
+    def search(self, vector, k=5, metric="cosine", exclude=None):
+        """
+        Returns up to k (username, distance) pairs, best first, one per user.
+        metric = "cosine" (1 - cos) or "euclidean_l2" (L2 between unit vectors).
+        exclude = usernames whose rows are ignored (superseded by newer data).
+        """
+        if len(self.matrix) == 0:
+            return []
+
+        query = _normalize_rows(np.asarray(vector, dtype=np.float32)[np.newaxis, :])[0]
+        rows, scores = self._candidate_scores(query)
+        if len(scores) == 0:
+            # Every probed list is empty (k-means can leave lists unused)
+            return []
+
+        if metric == "cosine":
+            distances = 1.0 - scores
+        elif metric == "euclidean_l2":
+            distances = np.sqrt(np.maximum(2.0 - 2.0 * scores, 0.0))
+        else:
+            raise ValueError(f"Unsupported metric: {metric}")
+
+        if exclude:
+            excluded = [i for i, name in enumerate(self.names) if name in exclude]
+            if excluded:
+                distances = np.where(np.isin(self.ids[rows], excluded), np.inf, distances)
+
+        # Users may own several rows; over-fetch then keep each user's best row
+        fetch = min(len(distances), k * 4)
+        top = np.argpartition(distances, fetch - 1)[:fetch]
+        top = top[np.argsort(distances[top])]
+
+        results, seen = [], set()
+        for i in top:
+            if not np.isfinite(distances[i]):
+                break
+            label = self.names[self.ids[rows[i]]]
+            if label in seen:
+                continue
+            seen.add(label)
+            results.append((label, float(distances[i])))
+            if len(results) == k:
+                break
+        return results
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1e-10
+    return (matrix / norms).astype(np.float32)
+
+
+def _enrolled_usernames():
+    """
+    Users with at least one catalogued face image.
+    """
+    return template_usernames()
+
+
+# -----------------------------
+# Memory-mapped Snapshot
+# -----------------------------
+# One file per gallery version, read by every worker with np.memmap so the
+# matrix lives once in the page cache instead of once per worker heap:
+#
+#   header (64 bytes) | matrix float32 [rows, dims] | ids int32 [rows]
+#   | centroids float32 [nlist, dims] | offsets int64 [nlist + 1] | names JSON
+#
+# Sections start on 64-byte boundaries. A new version is written to a temp
+# file and renamed over the old one, so readers see either version whole;
+# workers that still map the old file keep its (unlinked) pages until they swap.
+SNAPSHOT_DIR = os.path.join(settings.MEDIA_ROOT, "face_index")
+SNAPSHOT_PATH = os.path.join(SNAPSHOT_DIR, "gallery.snap")
+os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+
+SNAPSHOT_MAGIC = b"AEFG"
+SNAPSHOT_FORMAT = 2
+# magic, format, version, gallery generation, rows, dims, nlist, nprobe, names length
+_HEADER = struct.Struct("<4sIQqIIIIQ")
+_HEADER_SIZE = 64
+
+
+def _aligned(offset):
+    return (offset + 63) // 64 * 64
+
+
+def _section_offsets(rows, dims, nlist):
+    matrix = _HEADER_SIZE
+    ids = _aligned(matrix + rows * dims * 4)
+    centroids = _aligned(ids + rows * 4)
+    offsets = _aligned(centroids + nlist * dims * 4)
+    names = _aligned(offsets + (nlist + 1) * 8 if nlist else offsets)
+    return matrix, ids, centroids, offsets, names
+
+
+def read_snapshot_header(path=SNAPSHOT_PATH):
+    """
+    Header fields of the published snapshot, or None if there is none.
+    """
+    try:
+        with open(path, "rb") as f:
+            raw = f.read(_HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(raw) < _HEADER.size:
+        return None
+
+    magic, fmt, version, generation, rows, dims, nlist, nprobe, names_length = _HEADER.unpack(raw)
+    if magic != SNAPSHOT_MAGIC or fmt != SNAPSHOT_FORMAT:
+        return None
+    return {
+        "version": version,
+        "generation": generation,
+        "rows": rows,
+        "dims": dims,
+        "nlist": nlist,
+        "nprobe": nprobe,
+        "names_length": names_length,
+    }
+
+
+def publish_snapshot(index, generation, path=SNAPSHOT_PATH):
+    """
+    Writes index as the next snapshot version and atomically swaps it in.
+    generation = last GalleryEvent id already reflected in the index.
+    Returns the new version number.
+    """
+    previous = read_snapshot_header(path)
+    version = previous["version"] + 1 if previous else 1
+    rows = len(index)
+    dims = index.matrix.shape[1] if rows else 0
+    nlist = len(index.centroids) if index.centroids is not None else 0
+    names = json.dumps(index.names).encode("utf-8")
+    sections = _section_offsets(rows, dims, nlist)
+    payloads = [index.matrix, index.ids]
+    if nlist:
+        payloads += [index.centroids, np.asarray(index.offsets, dtype=np.int64)]
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT, version, generation, rows, dims, nlist, index.nprobe, len(names)))
+        for offset, payload in zip(sections, payloads):
+            f.seek(offset)
+            f.write(np.ascontiguousarray(payload).tobytes())
+        f.seek(sections[4])
+        f.write(names)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return version
+
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    """
+    Maps a published snapshot read-only. Returns a FaceIndex whose matrix is
+    backed by the page cache, or None if there is no valid snapshot.
+    """
+    header = read_snapshot_header(path)
+    if header is None:
+        return None
+
+    rows, dims, nlist = header["rows"], header["dims"], header["nlist"]
+    matrix_at, ids_at, centroids_at, offsets_at, names_at = _section_offsets(rows, dims, nlist)
+    index = FaceIndex.__new__(FaceIndex)
+    if rows:
+        index.matrix = np.memmap(path, dtype=np.float32, mode="r", offset=matrix_at, shape=(rows, dims))
+        index.ids = np.memmap(path, dtype=np.int32, mode="r", offset=ids_at, shape=(rows,))
+    else:
+        index.matrix = np.empty((0, 0), dtype=np.float32)
+        index.ids = np.empty(0, dtype=np.int32)
+    index.centroids = None
+    index.offsets = None
+    if nlist:
+        index.centroids = np.memmap(path, dtype=np.float32, mode="r", offset=centroids_at, shape=(nlist, dims))
+        index.offsets = np.memmap(path, dtype=np.int64, mode="r", offset=offsets_at, shape=(nlist + 1,))
+    with open(path, "rb") as f:
+        f.seek(names_at)
+        index.names = json.loads(f.read(header["names_length"]).decode("utf-8"))
+    index.nprobe = header["nprobe"]
+    index.version = header["version"]
+    index.generation = header["generation"]
+    return index
+
+
+@contextmanager
+def _publish_lock(blocking=True):
+    """
+    Cross-process lock so only one worker rebuilds the snapshot at a time.
+    Yields False when blocking=False and another worker holds it.
+    """
+    if fcntl is None:
+        yield True
+        return
+    with open(os.path.join(SNAPSHOT_DIR, "publish.lock"), "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# -----------------------------
+# Gallery Change Events
+# -----------------------------
+def notify_gallery_change(username, source):
+    """
+    Records that a user's enrolled faces changed (call after their embedding
+    store was written). Every worker picks the change up within
+    settings.FACE_INDEX_POLL_SECONDS by re-reading that one user.
+    """
+    event = GalleryEvent.objects.create(username=username, source=source)
+    print(f"[Index] Gallery generation {event.id}: {username} ({source})")
+    return event.id
+
+
+def _latest_generation():
+    return GalleryEvent.objects.order_by("-id").values_list("id", flat=True).first() or 0
+
+
+def _events_since(generation):
+    """
+    (usernames changed after generation, newest generation seen).
+    """
+    usernames, latest = set(), generation
+    for event_id, username in GalleryEvent.objects.filter(id__gt=generation).values_list("id", "username"):
+        usernames.add(username)
+        latest = max(latest, event_id)
+    return usernames, latest
+
+
+# -----------------------------
+# Shared Process Index
+# -----------------------------
+class LiveFaceIndex:
+    """
+    The mapped snapshot plus an in-process overlay of users changed since it
+    was published. Applying a change re-reads only that user's store; their
+    snapshot rows are masked at query time.
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.generation = base.generation
+        self.overlay = {}
+        self.overlay_index = None
+
+    def __len__(self):
+        return len(self.base) + sum(len(vectors) for vectors in self.overlay.values())
+
+    @property
+    def version(self):
+        return self.base.version
+
+    def apply(self, usernames, generation):
+        for username in usernames:
+            names, vectors = get_user_embeddings(username)
+            self.overlay[username] = vectors if len(names) else np.empty((0, 0), dtype=np.float32)
+
+        rows = [(username, vectors) for username, vectors in self.overlay.items() if len(vectors)]
+        self.overlay_index = FaceIndex(
+            np.vstack([vectors for _, vectors in rows]),
+            [username for username, vectors in rows for _ in range(len(vectors))],
+        ) if rows else None
+        self.generation = generation
+
+    def search(self, vector, k=5, metric="cosine"):
+        results = self.base.search(vector, k=k, metric=metric, exclude=self.overlay)
+        if self.overlay_index is not None:
+            results = sorted(results + self.overlay_index.search(vector, k=k, metric=metric), key=lambda r: r[1])
+        return results[:k]
+
+
+_index_lock = threading.Lock()
+_index_cache = {"index": None, "checked_at": 0.0}
+
+
+def _build_and_publish():
+    # Read the generation first: events racing the build are re-applied, which is harmless
+    generation = _latest_generation()
+    built = FaceIndex.from_store(
+        nlist=settings.FACE_INDEX_IVF_LISTS,
+        nprobe=settings.FACE_INDEX_IVF_PROBES,
+    )
+    version = publish_snapshot(built, generation)
+    print(f"[Index] Published snapshot v{version} (generation {generation}) with {len(built)} embedding(s)")
+
+    # Workers holding an older snapshot remap this one before reading events
+    GalleryEvent.objects.filter(id__lte=generation).delete()
+
+
+def _refresh(live):
+    """
+    Brings a process's index up to the latest generation: maps a newer
+    snapshot if one was published, otherwise applies the pending events.
+    """
+    header = read_snapshot_header()
+    if header is None or header["nlist"] != _expected_nlist(header["rows"]):
+        with _publish_lock():
+            header = read_snapshot_header()
+            if header is None or header["nlist"] != _expected_nlist(header["rows"]):
+                _build_and_publish()
+        live = None
+
+    if live is None or read_snapshot_header()["version"] != live.version:
+        live = LiveFaceIndex(load_snapshot())
+
+    usernames, latest = _events_since(live.generation)
+    if usernames:
+        live.apply(usernames, latest)
+
+    # Fold a long overlay into a new snapshot; one worker does it, the rest keep serving
+    if len(live.overlay) >= settings.FACE_INDEX_COMPACT_USERS:
+        with _publish_lock(blocking=False) as acquired:
+            if acquired and read_snapshot_header()["version"] == live.version:
+                _build_and_publish()
+    return live
+
+
+def _expected_nlist(rows):
+    nlist = settings.FACE_INDEX_IVF_LISTS
+    return nlist if nlist and rows > nlist else 0
+
+
+def get_face_index():
+    """
+    Process-wide index: the shared snapshot plus the changes recorded since,
+    re-checked at most every settings.FACE_INDEX_POLL_SECONDS.
+    """
+    with _index_lock:
+        now = time.monotonic()
+        live = _index_cache["index"]
+        if live is None or now - _index_cache["checked_at"] >= settings.FACE_INDEX_POLL_SECONDS:
+            live = _refresh(live)
+            _index_cache["index"] = live
+            _index_cache["checked_at"] = now
+        return live
+
+
+def index_status():
+    """
+    Snapshot version and generation this process holds, for the health endpoint.
+    """
+    live = _index_cache["index"]
+    header = read_snapshot_header()
+    return {
+        "mapped_version": live.version if live is not None else None,
+        "published_version": header["version"] if header else None,
+        "generation": live.generation if live is not None else None,
+        "overlay_users": len(live.overlay) if live is not None else 0,
+        "embeddings": len(live) if live is not None else 0,
+    }
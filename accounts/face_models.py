@@ -0,0 +1,102 @@
+import threading
+import time
+import numpy as np
+
+# -----------------------------
+# Process-wide Model Registry
+# -----------------------------
+# DeepFace caches built models per process; this registry builds them up front,
+# runs one warm-up inference and records whether this worker is ready to scan.
+_lock = threading.Lock()
+_state = {
+    "status": "cold",  # cold -> loading -> ready / error
+    "model": None,
+    "backend": None,
+    "detector": None,
+    "load_seconds": None,
+    "error": None,
+}
+
+
+def load_models():
+    """
+    Builds the recognition model and detector once for this process and
+    runs a warm-up inference on a synthetic frame. Safe to call repeatedly.
+    Returns True when the models are ready.
+    """
+    with _lock:
+        if _state["status"] == "ready":
+            return True
+
+        from deepface import DeepFace
+        from deepface.modules import modeling
+        from django.conf import settings
+        from .face_backends import get_backend
+        from .face_embeddings import DETECTOR_BACKEND, MODEL_NAME
+
+        _state["status"] = "loading"
+        started = time.monotonic()
+        backend = get_backend()
+        try:
+            backend.load()
+            detectors = [DETECTOR_BACKEND] + [
+                stage for stage in settings.FACE_DETECTOR_CASCADE
+                if stage not in ("skip", DETECTOR_BACKEND)
+            ]
+            for detector in detectors:
+                modeling.build_model(task="face_detector", model_name=detector)
+
+            # First inference allocates graphs/kernels; pay it here, not on a scan
+            synthetic_frame = np.full((160, 160, 3), 128, dtype=np.uint8)
+            DeepFace.extract_faces(synthetic_frame, detector_backend=DETECTOR_BACKEND, enforce_detection=False)
+            backend.embed([synthetic_frame])
+        except Exception as e:
+            _state["status"] = "error"
+            _state["error"] = str(e)
+            print(f"[Models] Warm-up failed: {e}")
+            return False
+
+        _state["status"] = "ready"
+        _state["model"] = MODEL_NAME
+        _state["backend"] = backend.name
+        _state["detector"] = ",".join(detectors)
+        _state["load_seconds"] = round(time.monotonic() - started, 3)
+        _state["error"] = None
+        print(f"[Models] {MODEL_NAME} ({backend.name})/{_state['detector']} ready in {_state['load_seconds']}s")
+        return True
+
+
+def ensure_loaded():
+    """
+    Lazily warms the registry when the worker was not warmed at startup.
+    """
+    if _state["status"] != "ready":
+        load_models()
+
+
+def start_background_warmup():
+    """
+    Warms the models on a daemon thread so the worker can answer health checks
+    (as not ready) while TensorFlow loads.
+    """
+    thread = threading.Thread(target=load_models, name="face-model-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def is_ready():
+    return _state["status"] == "ready"
+
+
+def model_status():
+    """
+    Snapshot of the registry state for the health endpoint.
+    """
+    return {
+        "status": _state["status"],
+        "model": _state["model"],
+        "backend": _state["backend"],
+        "detector": _state["detector"],
+        "load_seconds": _state["load_seconds"],
+        "error": _state["error"],
+    }
@@ -54,12 +54,13 @@
 
 import os
 import cv2
-import pickle
 import numpy as np
 from datetime import datetime
 from django.conf import settings
-from deepface import DeepFace
 from .models import Attendance, CustomUser
+from .face_embeddings import MATCH_THRESHOLD, add_user_embedding, get_user_embeddings, represent_all_faces, represent_live_face
+from .face_index import FaceIndex, get_face_index, notify_gallery_change
+from .face_templates import add_numbered_template
 
 # -----------------------------
 # Paths & Directories
@@ -67,11 +68,6 @@ from .models import Attendance, CustomUser
 FACE_DB = os.path.join(settings.MEDIA_ROOT, "faces")
 os.makedirs(FACE_DB, exist_ok=True)
 
-TEMP_IMAGE = os.path.join(settings.MEDIA_ROOT, "temp.jpg")
-
-# Optional embeddings file (if you want to save embeddings)
-EMBEDDINGS_FILE = os.path.join(settings.MEDIA_ROOT, "face_embeddings.pkl")
-
 # -----------------------------
 # Add Face Image
 # -----------------------------
@@ -80,15 +76,12 @@ def add_face_image(username, img):
     Saves user's face image and updates embeddings.
     img = OpenCV frame (BGR)
     """
-    user_folder = os.path.join(FACE_DB, username)
-    os.makedirs(user_folder, exist_ok=True)
-
-    # Save image with incremental name
-    img_count = len(os.listdir(user_folder))
-    img_path = os.path.join(user_folder, f"{username}_{img_count+1}.jpg")
-    cv2.imwrite(img_path, img)
+    # Save image with the next catalogued number
+    img_path = add_numbered_template(username, "enrollment", img=img)
 
     print(f"[Face Added] Saved image for user: {username}")
+    add_user_embedding(username, img_path, img=img)
+    notify_gallery_change(username, "enrollment")
     return img_path
 
 # -----------------------------
@@ -96,51 +89,77 @@ def add_face_image(username, img):
 # -----------------------------
 def recognize_face(frame, threshold=0.45):
     """
-    Recognize face from frame using DeepFace.verify against stored images.
+    Recognize face from frame by embedding it once and searching the
+    in-memory index of all enrolled embeddings.
     Returns username if match found.
     """
-    # Save frame temporarily
-    cv2.imwrite(TEMP_IMAGE, frame)
-
-    best_match = None
-    best_distance = 10.0
-
-    for username in os.listdir(FACE_DB):
-        user_folder = os.path.join(FACE_DB, username)
-        if not os.path.isdir(user_folder):
-            continue
-
-        for img_file in os.listdir(user_folder):
-            db_img_path = os.path.join(user_folder, img_file)
-            try:
-                result = DeepFace.verify(
-                    TEMP_IMAGE,
-                    db_img_path,
-                    model_name="Facenet",
-                    detector_backend="mtcnn",  # more reliable than opencv
-                    enforce_detection=True
-                )
-                distance = result["distance"]
-                verified = result["verified"]
-
-                if verified and distance < best_distance:
-                    best_distance = distance
-                    best_match = username
-
-            except Exception as e:
-                print(f"[Verify Error] {db_img_path}: {e}")
-                continue
-
-    if best_match and best_distance < threshold:
-        print(f"[Recognize] Best match: {best_match} (distance={best_distance:.3f})")
+    # Embed the decoded frame directly; no per-request file I/O
+    try:
+        live_vector, detector = represent_live_face(frame)
+    except Exception as e:
+        print(f"[Verify Error] live frame: {e}")
+        return None
+
+    best_match, best_distance = identify_embedding(live_vector, threshold)
+    if best_match:
+        print(f"[Recognize] Best match: {best_match} via {detector} (distance={best_distance:.3f})")
         return best_match
 
     print("[Recognize] No face detected or match unclear.")
     return None
 
-# -----------------------------
-# Mark Attendance
-# -----------------------------
+def identify_embedding(vector, threshold=0.45):
+    """
+    Closest enrolled user for an embedding, searched in the shared index.
+    Returns (username, distance), or (None, distance) when nobody is close enough.
+    """
+    matches = get_face_index().search(vector, k=1)
+    if not matches:
+        return None, None
+    best_match, best_distance = matches[0]
+    if best_distance <= MATCH_THRESHOLD and best_distance < threshold:
+        return best_match, best_distance
+    return None, best_distance
+
+def recognize_classroom(photo, usernames, threshold=0.45):
+    """
+    Recognizes every face in one classroom photo against a roster only.
+    All faces are embedded in one batch; each student is matched to at most
+    one face (closest first) and each face to at most one student.
+    Returns {"faces": N, "matches": {username: {"distance", "area"}}, "unmatched": [areas]}.
+    """
+    vectors, areas = represent_all_faces(photo)
+
+    roster_vectors, labels = [], []
+    for username in usernames:
+        names, user_vectors = get_user_embeddings(username)
+        if len(names):
+            roster_vectors.append(user_vectors)
+            labels.extend([username] * len(names))
+
+    if not len(areas) or not labels:
+        return {"faces": len(areas), "matches": {}, "unmatched": list(areas)}
+
+    # A small index over this roster only, so other classes can never match
+    index = FaceIndex(np.vstack(roster_vectors), labels)
+    limit = min(MATCH_THRESHOLD, threshold)
+    candidates = []
+    for face_i, vector in enumerate(vectors):
+        for username, distance in index.search(vector, k=3):
+            if distance <= limit:
+                candidates.append((distance, face_i, username))
+
+    matches, used_faces = {}, set()
+    for distance, face_i, username in sorted(candidates):
+        if username in matches or face_i in used_faces:
+            continue
+        matches[username] = {"distance": round(distance, 4), "area": areas[face_i]}
+        used_faces.add(face_i)
+
+    unmatched = [area for i, area in enumerate(areas) if i not in used_faces]
+    print(f"[Classroom] {len(matches)}/{len(usernames)} student(s) matched from {len(areas)} face(s)")
+    return {"faces": len(areas), "matches": matches, "unmatched": unmatched}
+
 def mark_user_attendance(user):
     """
     Records attendance for a given user.
@@ -0,0 +1,276 @@
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+from django.conf import settings
+
+# -----------------------------
+# Wire Protocol
+# -----------------------------
+# Each message is: 8-byte prefix (header length, payload length) + JSON header
+# + raw payload. Frames travel as raw BGR pixels, so nothing is re-encoded.
+_PREFIX = struct.Struct("!II")
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        chunk = sock.recv_into(view[received:], size - received)
+        if not chunk:
+            raise ConnectionError("Recognition service closed the connection")
+        received += chunk
+    return buffer
+
+
+def send_message(sock, header, payload=b""):
+    head = json.dumps(header).encode("utf-8")
+    sock.sendall(_PREFIX.pack(len(head), len(payload)) + head)
+    if len(payload):
+        sock.sendall(payload)
+
+
+def recv_message(sock):
+    head_size, payload_size = _PREFIX.unpack(_recv_exact(sock, _PREFIX.size))
+    header = json.loads(bytes(_recv_exact(sock, head_size)).decode("utf-8"))
+    payload = _recv_exact(sock, payload_size) if payload_size else b""
+    return header, payload
+
+
+# -----------------------------
+# Client (used by web workers)
+# -----------------------------
+def _request(header, payload=b"", with_payload=False):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(settings.FACE_SERVICE_TIMEOUT)
+        sock.connect(settings.FACE_SERVICE_SOCKET)
+        send_message(sock, header, payload)
+        response, response_payload = recv_message(sock)
+
+    if not response.get("ok"):
+        raise ValueError(response.get("error", "Recognition service error"))
+    return (response, response_payload) if with_payload else response
+
+
+def remote_represent(img, mode="live"):
+    """
+    Embeds an image on the recognition service.
+    img = image path (read by the service) or OpenCV frame (BGR).
+    mode = "live" (detector cascade), "enroll" (reference detector) or
+    "aligned" (img is a stored 160x160 crop; no detection).
+    Returns (embedding, stage).
+    """
+    if isinstance(img, (str, os.PathLike)):
+        response = _request({"op": "embed", "mode": mode, "path": os.fspath(img)})
+    else:
+        frame = np.ascontiguousarray(img, dtype=np.uint8)
+        response = _request(
+            {"op": "embed", "mode": mode, "shape": list(frame.shape)},
+            memoryview(frame).cast("B"),
+        )
+    return np.asarray(response["embedding"], dtype=np.float32), response["detector"]
+
+
+def remote_align(img):
+    """
+    Detects and aligns the largest face on the recognition service.
+    Returns the 160x160 BGR crop.
+    """
+    if isinstance(img, (str, os.PathLike)):
+        response, payload = _request({"op": "align", "path": os.fspath(img)}, with_payload=True)
+    else:
+        frame = np.ascontiguousarray(img, dtype=np.uint8)
+        response, payload = _request(
+            {"op": "align", "shape": list(frame.shape)}, memoryview(frame).cast("B"), with_payload=True
+        )
+    return np.frombuffer(payload, dtype=np.uint8).reshape(response["shape"]).copy()
+
+
+def remote_represent_all(img):
+    """
+    Embeds every face in a group photo on the recognition service.
+    Returns (vectors, facial_areas).
+    """
+    frame = np.ascontiguousarray(img, dtype=np.uint8)
+    response = _request({"op": "embed_all", "shape": list(frame.shape)}, memoryview(frame).cast("B"))
+    vectors = np.asarray(response["embeddings"], dtype=np.float32)
+    return (vectors if len(vectors) else np.empty((0, 0), dtype=np.float32)), response["areas"]
+
+
+def service_status():
+    """
+    The service's model registry state, or an error state if it is unreachable.
+    """
+    try:
+        return _request({"op": "status"})["models"]
+    except (OSError, ValueError) as e:
+        return {"status": "unreachable", "error": str(e)}
+
+
+# -----------------------------
+# Micro-batching Server
+# -----------------------------
+class _PendingEmbed:
+    __slots__ = ("image", "mode", "future")
+
+    def __init__(self, image, mode):
+        self.image = image
+        self.mode = mode
+        self.future = Future()
+
+
+class RecognitionService:
+    """
+    Owns the face models for every web worker on the host. Frames from
+    concurrent requests are collected for up to max_wait_ms (or max_batch
+    frames) and embedded with one batched forward pass.
+    """
+
+    def __init__(self, socket_path, max_batch=16, max_wait_ms=20):
+        self.socket_path = socket_path
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.pending = queue.Queue()
+        self.batches = 0
+        self.frames = 0
+
+    def submit(self, image, mode):
+        item = _PendingEmbed(image, mode)
+        self.pending.put(item)
+        return item.future
+
+    def _collect_batch(self):
+        batch = [self.pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_batch(self, batch):
+        from .face_embeddings import DETECTOR_BACKEND, detect_face, embed_faces
+
+        crops, owners = [], []
+        for item in batch:
+            if item.mode == "aligned":
+                crops.append(item.image)
+                owners.append((item, "aligned"))
+                continue
+            cascade = [DETECTOR_BACKEND] if item.mode == "enroll" else None
+            try:
+                face, stage = detect_face(item.image, cascade=cascade)
+            except Exception as e:
+                item.future.set_exception(e)
+                continue
+            crops.append(face)
+            owners.append((item, stage))
+
+        if not crops:
+            return
+        try:
+            embeddings = embed_faces(crops)
+        except Exception as e:
+            for item, _ in owners:
+                item.future.set_exception(e)
+            return
+
+        for (item, stage), embedding in zip(owners, embeddings):
+            item.future.set_result((embedding, stage))
+
+        self.batches += 1
+        self.frames += len(crops)
+
+    def batch_loop(self):
+        while True:
+            self._run_batch(self._collect_batch())
+
+    def serve_forever(self):
+        from .face_models import load_models
+
+        load_models()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        service = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                header, payload = recv_message(self.request)
+                response = service.handle_request(header, payload)
+                # Ops that return pixels answer with (header, payload)
+                send_message(self.request, *(response if isinstance(response, tuple) else (response,)))
+
+        class Server(socketserver.ThreadingUnixStreamServer):
+            daemon_threads = True
+            # Every worker may connect at once during the morning rush
+            request_queue_size = 128
+
+        threading.Thread(target=self.batch_loop, name="face-batcher", daemon=True).start()
+        with Server(self.socket_path, Handler) as server:
+            print(f"[Service] Recognition service listening on {self.socket_path}")
+            server.serve_forever()
+
+    def handle_request(self, header, payload):
+        from .face_models import model_status
+
+        op = header.get("op")
+        if op == "status":
+            return {"ok": True, "models": model_status(), "batches": self.batches, "frames": self.frames}
+        if op == "embed_all":
+            return self.embed_all(np.frombuffer(payload, dtype=np.uint8).reshape(header["shape"]))
+        if op == "align":
+            return self.align(header["path"] if "path" in header else np.frombuffer(payload, dtype=np.uint8).reshape(header["shape"]))
+        if op != "embed":
+            return {"ok": False, "error": f"Unknown op: {op}"}
+
+        if "path" in header:
+            image = header["path"]
+        else:
+            image = np.frombuffer(payload, dtype=np.uint8).reshape(header["shape"])
+
+        future = self.submit(image, header.get("mode", "live"))
+        try:
+            embedding, stage = future.result(timeout=settings.FACE_SERVICE_TIMEOUT)
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+        return {"ok": True, "embedding": embedding.tolist(), "detector": stage}
+
+    def embed_all(self, image):
+        """
+        A group photo is already a batch, so it skips the micro-batch queue.
+        """
+        from .face_embeddings import detect_all_faces, embed_faces
+
+        try:
+            faces, areas = detect_all_faces(image)
+            embeddings = embed_faces(faces).tolist() if faces else []
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+        self.frames += len(faces)
+        return {"ok": True, "embeddings": embeddings, "areas": areas}
+
+    def align(self, image):
+        """
+        Enrollment-time detection: runs once per stored image, so it skips
+        the micro-batch queue like embed_all.
+        """
+        from .face_embeddings import align_face
+
+        try:
+            crop = np.ascontiguousarray(align_face(image), dtype=np.uint8)
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+        return {"ok": True, "shape": list(crop.shape)}, memoryview(crop).cast("B")
@@ -3,8 +3,16 @@ import cv2
 import numpy as np
 from datetime import datetime
 from django.conf import settings
-from deepface import DeepFace
 from .models import Attendance, CustomUser
+from .face_embeddings import (
+    MATCH_THRESHOLD,
+    add_user_embedding,
+    cosine_distances,
+    get_user_gallery,
+    represent_live_face,
+)
+from .face_index import notify_gallery_change
+from .face_templates import add_numbered_template
 
 # -----------------------------
 # Paths & Directories
@@ -12,8 +20,6 @@ from .models import Attendance, CustomUser
 FACE_DB = os.path.join(settings.MEDIA_ROOT, "faces")
 os.makedirs(FACE_DB, exist_ok=True)
 
-TEMP_IMAGE = os.path.join(settings.MEDIA_ROOT, "temp.jpg")
-
 # -----------------------------
 # Add Face Image
 # -----------------------------
@@ -22,15 +28,12 @@ def add_face_image(username, img):
     Saves user's face image and updates embeddings.
     img = OpenCV frame (BGR)
     """
-    user_folder = os.path.join(FACE_DB, username)
-    os.makedirs(user_folder, exist_ok=True)
-
-    # Save image with incremental name
-    img_count = len(os.listdir(user_folder))
-    img_path = os.path.join(user_folder, f"{username}_{img_count+1}.jpg")
-    cv2.imwrite(img_path, img)
+    # Save image with the next catalogued number
+    img_path = add_numbered_template(username, "enrollment", img=img)
 
     print(f"[Face Added] Saved image for user: {username}")
+    add_user_embedding(username, img_path, img=img)
+    notify_gallery_change(username, "enrollment")
 
     # -------------------------------
     # Update has_face_data for first image
@@ -48,72 +51,66 @@ def add_face_image(username, img):
 # -----------------------------
 import os
 import cv2
-from deepface import DeepFace
 from django.conf import settings
 from .models import CustomUser
 
-def recognize_logged_in_user(frame, username, threshold=0.45):
+def match_logged_in_user(frame, username, threshold=0.45):
     """
     Recognize only the logged-in user's approved face images.
     Ignores pending/unapproved images.
-    Returns username if match found, else None.
+    Embeds the frame once and compares it with the user's centroid; the
+    individual templates are only consulted when the centroid distance is
+    within settings.FACE_CENTROID_MARGIN of the threshold.
+    Returns a dict with the matched username (or None), the best distance
+    and the detector stage that found the face.
     """
-    # Paths
-    FACE_DB = os.path.join(settings.MEDIA_ROOT, "faces")
-    PENDING_DB = os.path.join(settings.MEDIA_ROOT, "pending_faces")
-    user_folder = os.path.join(FACE_DB, username)
-    
-    # Check if user has face data
-    if not os.path.exists(user_folder) or len(os.listdir(user_folder)) == 0:
-        return None
+    result = {"username": None, "distance": None, "detector": None}
+
+    # Check if user has face data (catalogued, approved images only)
+    names, vectors, centroid = get_user_gallery(username)
+    if len(names) == 0:
+        return result
+
+    # Embed the decoded frame directly; no per-request file I/O
+    try:
+        live_vector, result["detector"] = represent_live_face(frame)
+    except Exception as e:
+        print(f"[Verify Error] live frame: {e}")
+        return result
+
+    effective = min(MATCH_THRESHOLD, threshold)
+    best_distance = float(cosine_distances(live_vector, centroid[np.newaxis, :])[0])
+    matched_on = "centroid"
+
+    # Clear accept or clear reject on the centroid alone; near the threshold,
+    # the closest individual template decides
+    if abs(best_distance - effective) <= settings.FACE_CENTROID_MARGIN:
+        distances = cosine_distances(live_vector, vectors)
+        best_index = int(np.argmin(distances))
+        best_distance = min(best_distance, float(distances[best_index]))
+        matched_on = names[best_index]
+    result["distance"] = round(best_distance, 4)
+
+    if best_distance <= MATCH_THRESHOLD and best_distance < threshold:
+        print(f"[Recognize] Matched {username} on {matched_on} via {result['detector']} (distance={best_distance:.3f})")
+        result["username"] = username
+        return result
 
-    # Save current frame temporarily
-    temp_image = os.path.join(settings.MEDIA_ROOT, "temp.jpg")
-    cv2.imwrite(temp_image, frame)
-
-    best_match = None
-    best_distance = 10.0
+    print("[Recognize] No match or unclear face for logged-in user.")
+    return result
 
-    # Loop through user's approved images
-    for img_file in os.listdir(user_folder):
-        db_img_path = os.path.join(user_folder, img_file)
-        try:
-            result = DeepFace.verify(
-                temp_image,
-                db_img_path,
-                model_name="Facenet",
-                detector_backend="mtcnn",
-                enforce_detection=True
-            )
-            distance = result["distance"]
-            verified = result["verified"]
-
-            if verified and distance < best_distance:
-                best_distance = distance
-                best_match = username
-
-        except Exception as e:
-            print(f"[Verify Error] {db_img_path}: {e}")
-            continue
-
-    # Ignore pending images (new uploads waiting for admin approval)
-    if os.path.exists(PENDING_DB):
-        pending_files = [
-            f for f in os.listdir(PENDING_DB) 
-            if f.startswith(username)
-        ]
-        if pending_files:
-            print(f"[Info] User has pending unapproved images: {pending_files}")
-
-    if best_match and best_distance < threshold:
-        return best_match
 
-    print("[Recognize] No match or unclear face for logged-in user.")
-    return None
+def recognize_logged_in_user(frame, username, threshold=0.45):
+    """
+    Returns username if the frame matches the logged-in user, else None.
+    """
+    return match_logged_in_user(frame, username, threshold)["username"]
 # -----------------------------
 # Decode Base64 Image
 # -----------------------------
 import base64
+import binascii
+import json
 
 def decode_base64_image(data_url):
     """
@@ -121,6 +118,74 @@ def decode_base64_image(data_url):
     """
     header, encoded = data_url.split(",", 1)
     data = base64.b64decode(encoded)
+    if not data:
+        return None
     nparr = np.frombuffer(data, np.uint8)
     img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
     return img
+
+
+def decode_request_image(request, field="image"):
+    """
+    Decodes the uploaded frame of a POST request to an OpenCV BGR image.
+    Accepts the raw JPEG as application/octet-stream (or image/*), as a
+    multipart/form-data file under field, or the legacy JSON {"image_data": data URL}.
+    Raw bytes are handed to cv2.imdecode without copying. Returns None if absent.
+    """
+    content_type = request.content_type or ""
+
+    if content_type == "application/octet-stream" or content_type.startswith("image/"):
+        data = np.frombuffer(request.body, np.uint8)
+    elif content_type == "multipart/form-data":
+        upload = request.FILES.get(field)
+        if upload is None:
+            return None
+        source = upload.file
+        # Small uploads are in-memory BytesIO; view their buffer instead of read()
+        data = np.frombuffer(source.getbuffer() if hasattr(source, "getbuffer") else upload.read(), np.uint8)
+    else:
+        try:
+            image_data = json.loads(request.body).get("image_data")
+            # A malformed data URL is treated like a missing image, not a server error
+            return decode_base64_image(image_data) if image_data else None
+        except (ValueError, AttributeError, TypeError, binascii.Error):
+            return None
+
+    if not data.size:
+        return None
+    return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+
+# -----------------------------
+# Frame Quality Gate
+# -----------------------------
+def check_frame_quality(frame):
+    """
+    Cheap checks run right after decoding, before any model inference.
+    Downscales oversized frames toward the model input resolution.
+    Returns (frame, hint): hint is None for a usable frame, otherwise a
+    message telling the user what to fix.
+    """
+    if frame is None or frame.size == 0:
+        return frame, "Could not read the camera image. Please try again."
+
+    height, width = frame.shape[:2]
+    if min(height, width) < settings.FACE_MIN_FRAME_SIDE:
+        return frame, "Image is too small. Move closer to the camera."
+
+    scale = settings.FACE_MAX_FRAME_SIDE / min(height, width)
+    if scale < 1:
+        frame = cv2.resize(frame, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    brightness = float(gray.mean())
+    if brightness < settings.FACE_MIN_BRIGHTNESS:
+        return frame, "Image is too dark. Please face a light source."
+    if brightness > settings.FACE_MAX_BRIGHTNESS:
+        return frame, "Image is too bright. Avoid direct light behind or on the camera."
+
+    sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    if sharpness < settings.FACE_MIN_SHARPNESS:
+        return frame, "Image is blurry. Hold still and try again."
+
+    return frame, None
@@ -0,0 +1,171 @@
+import os
+import re
+import shutil
+import cv2
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+
+from .embedding_cache import file_sha256
+from .models import FaceTemplate, MasterUserRecord, UserFace
+
+# -----------------------------
+# Paths
+# -----------------------------
+FACE_DB = os.path.join(settings.MEDIA_ROOT, "faces")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def relative_path(path):
+    return os.path.relpath(path, settings.MEDIA_ROOT).replace("\\", "/")
+
+
+def absolute_path(image_path):
+    return os.path.join(settings.MEDIA_ROOT, image_path)
+
+
+def _sequence_from_name(username, img_name):
+    match = re.fullmatch(re.escape(username) + r"_(\d+)\.(jpe?g|png)", img_name, re.IGNORECASE)
+    return int(match.group(1)) if match else None
+
+
+# -----------------------------
+# Catalogue Queries
+# -----------------------------
+def template_files(username):
+    """
+    {image_name: (absolute_path, content_hash)} of a user's approved images,
+    from one indexed query instead of a directory listing.
+    """
+    return {
+        os.path.basename(image_path): (absolute_path(image_path), content_hash)
+        for image_path, content_hash in FaceTemplate.objects.filter(username=username).values_list(
+            "image_path", "content_hash"
+        )
+    }
+
+
+def template_usernames():
+    return sorted(set(FaceTemplate.objects.values_list("username", flat=True)))
+
+
+def referenced_template_names(username):
+    """
+    Image names a profile (UserFace) or master record points at; these are
+    never pruned because face_add compares against them.
+    """
+    paths = list(UserFace.objects.filter(user__username=username).values_list("face_image", flat=True))
+    paths += list(MasterUserRecord.objects.filter(username=username).values_list("face_image", flat=True))
+    return {os.path.basename(str(path)) for path in paths if path}
+
+
+# -----------------------------
+# Catalogue Writes
+# -----------------------------
+def add_numbered_template(username, source, img=None, src_path=None, attempts=5):
+    """
+    Stores a new <username>_N.jpg (from decoded pixels or by copying src_path)
+    and catalogues it. N is claimed by inserting the row first: the unique
+    (username, sequence) constraint makes concurrent approvals retry with the
+    next number instead of overwriting each other's file.
+    Returns the absolute path of the stored image.
+    """
+    for _ in range(attempts):
+        last = FaceTemplate.objects.filter(username=username).aggregate(last=Max("sequence"))["last"] or 0
+        sequence = last + 1
+        path = os.path.join(FACE_DB, username, f"{username}_{sequence}.jpg")
+        try:
+            with transaction.atomic():
+                template = FaceTemplate.objects.create(
+                    username=username,
+                    image_path=relative_path(path),
+                    sequence=sequence,
+                    source=source,
+                )
+        except IntegrityError:
+            continue
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if img is not None:
+            cv2.imwrite(path, img)
+        else:
+            shutil.copy(src_path, path)
+        template.content_hash = file_sha256(path)
+        template.save(update_fields=["content_hash"])
+        return path
+
+    raise RuntimeError(f"Could not allocate a face image number for {username}")
+
+
+def record_template(username, path, source):
+    """
+    Catalogues (or refreshes the hash of) an image stored under a fixed name,
+    e.g. <username>_new.jpg or <username>_default.jpg.
+    """
+    template, _ = FaceTemplate.objects.update_or_create(
+        image_path=relative_path(path),
+        defaults={
+            "username": username,
+            "sequence": _sequence_from_name(username, os.path.basename(path)),
+            "content_hash": file_sha256(path),
+            "source": source,
+        },
+    )
+    return template
+
+
+def remove_template(path):
+    FaceTemplate.objects.filter(image_path=relative_path(path)).delete()
+
+
+def delete_template(path):
+    """
+    Drops a pruned image from the catalogue and from disk.
+    """
+    remove_template(path)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def set_embedding_key(path, embedding_key):
+    FaceTemplate.objects.filter(image_path=relative_path(path)).update(embedding_key=embedding_key)
+
+
+def set_content_hash(path, content_hash):
+    FaceTemplate.objects.filter(image_path=relative_path(path)).update(content_hash=content_hash)
+
+
+def backfill_templates():
+    """
+    Catalogues images already in faces/<username>/ and drops rows whose file
+    is gone. Run once after upgrading (the migration does the same) and after
+    copying images into media/ by hand.
+    Returns (added, removed, usernames touched).
+    """
+    known = dict(FaceTemplate.objects.values_list("image_path", "username"))
+    added, touched = 0, set()
+    if os.path.isdir(FACE_DB):
+        for username in sorted(os.listdir(FACE_DB)):
+            user_folder = os.path.join(FACE_DB, username)
+            if not os.path.isdir(user_folder):
+                continue
+            for img_name in sorted(os.listdir(user_folder)):
+                path = os.path.join(user_folder, img_name)
+                if img_name.lower().endswith(IMAGE_EXTENSIONS) and relative_path(path) not in known:
+                    try:
+                        record_template(username, path, "backfill")
+                    except IntegrityError:
+                        # Sequence already taken by another file name: catalogue it unnumbered
+                        FaceTemplate.objects.create(
+                            username=username,
+                            image_path=relative_path(path),
+                            content_hash=file_sha256(path),
+                            source="backfill",
+                        )
+                    added += 1
+                    touched.add(username)
+
+    missing = [image_path for image_path in known if not os.path.exists(absolute_path(image_path))]
+    FaceTemplate.objects.filter(image_path__in=missing).delete()
+    touched.update(known[image_path] for image_path in missing)
+    return added, len(missing), touched
@@ -0,0 +1,117 @@
+import itertools
+import cv2
+
+# -----------------------------
+# Cheap Per-frame Detection
+# -----------------------------
+# Tracking only needs boxes, so every sampled frame goes through OpenCV's Haar
+# cascade; the heavy detector + Facenet run once per track, not per frame.
+_haar = None
+
+
+def detect_face_boxes(frame, min_size=60, detect_width=640):
+    """
+    Returns face boxes (x, y, w, h) in frame coordinates.
+    Large frames are shrunk to detect_width first.
+    """
+    global _haar
+    if _haar is None:
+        _haar = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+
+    scale = min(1.0, detect_width / frame.shape[1])
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    side = max(1, int(min_size * scale))
+    boxes = _haar.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(side, side))
+    return [tuple(int(v / scale) for v in box) for box in boxes]
+
+
+def crop_box(frame, box, margin=0.25):
+    """
+    The box grown by margin on every side (clipped to the frame), so the
+    reference detector has context to re-find and align the face.
+    """
+    x, y, w, h = box
+    dx, dy = int(w * margin), int(h * margin)
+    height, width = frame.shape[:2]
+    return frame[max(0, y - dy):min(height, y + h + dy), max(0, x - dx):min(width, x + w + dx)]
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+
+# -----------------------------
+# IoU Tracker
+# -----------------------------
+class FaceTrack:
+    """
+    One person passing the camera. identity stays None until recognition
+    succeeds; attempts counts recognition tries so far.
+    """
+
+    def __init__(self, track_id, box, now):
+        self.track_id = track_id
+        self.box = box
+        self.first_seen = now
+        self.last_seen = now
+        self.hits = 1
+        self.identity = None
+        self.distance = None
+        self.attempts = 0
+
+
+class FaceTracker:
+    """
+    Associates boxes between sampled frames by overlap (greedy, best IoU
+    first). Tracks not seen for ttl seconds are dropped.
+    """
+
+    def __init__(self, iou_threshold=0.3, ttl=2.0):
+        self.iou_threshold = iou_threshold
+        self.ttl = ttl
+        self.tracks = {}
+        self._ids = itertools.count(1)
+
+    def update(self, boxes, now):
+        """
+        Returns the tracks seen in this frame (new tracks included).
+        """
+        for track_id in [tid for tid, track in self.tracks.items() if now - track.last_seen > self.ttl]:
+            del self.tracks[track_id]
+
+        pairs = sorted(
+            ((iou(track.box, box), track_id, i) for track_id, track in self.tracks.items() for i, box in enumerate(boxes)),
+            reverse=True,
+        )
+        seen, used_tracks, used_boxes = [], set(), set()
+        for overlap, track_id, i in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if track_id in used_tracks or i in used_boxes:
+                continue
+            track = self.tracks[track_id]
+            track.box = boxes[i]
+            track.last_seen = now
+            track.hits += 1
+            used_tracks.add(track_id)
+            used_boxes.add(i)
+            seen.append(track)
+
+        for i, box in enumerate(boxes):
+            if i not in used_boxes:
+                track = FaceTrack(next(self._ids), box, now)
+                self.tracks[track.track_id] = track
+                seen.append(track)
+        return seen
+
+    def __len__(self):
+        return len(self.tracks)
@@ -0,0 +1,139 @@
+import os
+import time
+import cv2
+from django.conf import settings
+
+from .attendance_buffer import record_scan
+from .cooldown import cooldown_stats, get_recent_result, remember_result
+from .face_embeddings import represent_live_face
+from .face_scan_bulk import identify_embedding
+from .face_tracking import FaceTracker, crop_box, detect_face_boxes
+from .models import CustomUser
+
+
+# -----------------------------
+# Fixed-camera Kiosk
+# -----------------------------
+class KioskStream:
+    """
+    Reads a door camera (RTSP/MJPEG URL, webcam index or video file) and marks
+    attendance for people walking past. Frames are sampled at idle_fps while
+    nobody is in view and active_fps while someone is; each tracked face is
+    recognized once, so model cost follows the number of people, not the fps.
+    """
+
+    def __init__(self, source, device, idle_fps=1.0, active_fps=5.0, track_ttl=2.0,
+                 max_attempts=3, min_track_hits=2, threshold=0.45):
+        self.source = source
+        self.device = device
+        self.idle_interval = 1.0 / idle_fps
+        self.active_interval = 1.0 / active_fps
+        self.max_attempts = max_attempts
+        # A box must survive this many sampled frames before it is worth a model run
+        self.min_track_hits = min_track_hits
+        self.threshold = threshold
+        self.tracker = FaceTracker(ttl=track_ttl)
+        self.stats = {
+            "frames_read": 0,
+            "frames_sampled": 0,
+            "detections": 0,
+            "recognitions": 0,
+            "identified": 0,
+        }
+
+    def _open(self):
+        capture = cv2.VideoCapture(int(self.source) if str(self.source).isdigit() else self.source)
+        if not capture.isOpened():
+            raise ValueError(f"Cannot open video source: {self.source}")
+        return capture
+
+    def run(self, max_seconds=None):
+        """
+        Processes the stream until it ends (files) or max_seconds elapse.
+        Live sources are reopened when they drop.
+        """
+        is_file = os.path.isfile(str(self.source))
+        capture = self._open()
+        started = time.monotonic()
+        next_sample = 0.0
+        print(f"[Kiosk:{self.device}] Reading {self.source}")
+
+        try:
+            while max_seconds is None or time.monotonic() - started < max_seconds:
+                # grab() every frame keeps live buffers fresh; only sampled frames are decoded
+                if not capture.grab():
+                    if is_file:
+                        break
+                    print(f"[Kiosk:{self.device}] Stream dropped, reconnecting")
+                    capture.release()
+                    time.sleep(1.0)
+                    capture = self._open()
+                    continue
+
+                self.stats["frames_read"] += 1
+                # Files are sampled on their own timeline so results do not depend on CPU speed
+                now = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0 if is_file else time.monotonic()
+                if now < next_sample:
+                    continue
+
+                ok, frame = capture.retrieve()
+                if not ok:
+                    continue
+                self.process_frame(frame, now)
+                next_sample = now + (self.active_interval if len(self.tracker) else self.idle_interval)
+        finally:
+            capture.release()
+
+        print(f"[Kiosk:{self.device}] Stopped: {self.stats}, cooldown: {cooldown_stats()}")
+        return self.stats
+
+    def process_frame(self, frame, now):
+        self.stats["frames_sampled"] += 1
+        boxes = detect_face_boxes(frame)
+        self.stats["detections"] += len(boxes)
+
+        for track in self.tracker.update(boxes, now):
+            if track.identity or track.attempts >= self.max_attempts or track.hits < self.min_track_hits:
+                continue
+            self.identify(track, frame)
+
+    def identify(self, track, frame):
+        track.attempts += 1
+        self.stats["recognitions"] += 1
+        try:
+            vector, _ = represent_live_face(crop_box(frame, track.box))
+        except Exception as e:
+            print(f"[Kiosk:{self.device}] Track {track.track_id}: {e}")
+            return
+
+        username, distance = identify_embedding(vector, self.threshold)
+        track.distance = distance
+        if username:
+            track.identity = username
+            self.stats["identified"] += 1
+            self.on_identified(username, distance)
+
+    def on_identified(self, username, distance):
+        # Walking back past the door within the cooldown is not a check-out
+        recent = get_recent_result(username, device=self.device)
+        if recent:
+            print(f"[Kiosk:{self.device}] {username}: within cooldown, last {recent['type']} at {recent['time']}")
+            return
+
+        user = CustomUser.objects.filter(username=username).first()
+        if not user:
+            return
+        status, at, _ = record_scan(user, device=self.device, distance=distance)
+        remember_result(username, {"type": status, "time": at}, device=self.device)
+        print(f"[Kiosk:{self.device}] {username}: {status} {at or ''} (distance={distance:.3f})")
+
+
+def kiosk_from_settings(source, device):
+    return KioskStream(
+        source,
+        device,
+        idle_fps=settings.FACE_KIOSK_IDLE_FPS,
+        active_fps=settings.FACE_KIOSK_ACTIVE_FPS,
+        track_ttl=settings.FACE_KIOSK_TRACK_TTL,
+        max_attempts=settings.FACE_KIOSK_MAX_ATTEMPTS,
+    )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from accounts.face_index import notify_gallery_change
+from accounts.face_templates import backfill_templates
+
+
+class Command(BaseCommand):
+    help = (
+        "Catalogues face images found in media/faces/<username>/ that have no "
+        "FaceTemplate row, and drops rows whose file is gone."
+    )
+
+    def handle(self, *args, **options):
+        added, removed, usernames = backfill_templates()
+        for username in sorted(usernames):
+            notify_gallery_change(username, "backfill")
+        self.stdout.write(self.style.SUCCESS(f"Catalogued {added} image(s), removed {removed} stale row(s)."))
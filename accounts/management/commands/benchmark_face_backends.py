@@ -0,0 +1,136 @@
+import json
+import multiprocessing
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from accounts.face_backends import BACKEND_NAMES
+
+
+def _load_faces(images_dir, count):
+    """
+    Face crops from a folder of images, or seeded synthetic crops when no
+    folder is given (enough for latency/memory, not for accuracy).
+    """
+    import cv2
+
+    if images_dir:
+        faces = []
+        for name in sorted(os.listdir(images_dir)):
+            if name.lower().endswith((".jpg", ".jpeg", ".png")):
+                img = cv2.imread(os.path.join(images_dir, name))
+                if img is not None:
+                    faces.append(img)
+            if len(faces) == count:
+                break
+        if faces:
+            return faces
+
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, size=(160, 160, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+
+
+def _measure(backend_name, images_dir, iterations, batch_size):
+    """
+    Runs in a fresh spawned process so import time, model load and peak RSS
+    belong to this backend alone.
+    """
+    started = time.perf_counter()
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "attendease.settings")
+    import django
+    django.setup()
+
+    from accounts.face_backends import build_backend
+
+    rss_at_start = _peak_rss_mb()
+    faces = _load_faces(images_dir, max(batch_size, 8))
+    backend = build_backend(backend_name)
+    backend.load()
+    first = backend.embed(faces[:1])
+    startup_seconds = time.perf_counter() - started
+
+    latencies = []
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        backend.embed([faces[i % len(faces)]])
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+
+    batch = faces[:batch_size]
+    t0 = time.perf_counter()
+    rounds = max(1, iterations // batch_size)
+    for _ in range(rounds):
+        backend.embed(batch)
+    batch_seconds = time.perf_counter() - t0
+
+    return {
+        "startup_seconds": round(startup_seconds, 3),
+        "latency_ms": {
+            "p50": round(float(np.percentile(latencies, 50)), 2),
+            "p95": round(float(np.percentile(latencies, 95)), 2),
+            "p99": round(float(np.percentile(latencies, 99)), 2),
+        },
+        "batch_size": len(batch),
+        "batch_faces_per_second": round(rounds * len(batch) / batch_seconds, 1),
+        "rss_mb_after_django": rss_at_start,
+        "peak_rss_mb": _peak_rss_mb(),
+        "embedding_dims": int(first.shape[1]),
+        "reference_embeddings": backend.embed(faces[:8]).tolist(),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares face inference backends (DeepFace/TensorFlow vs ONNX Runtime): "
+        "cold start, single-face latency, batch throughput, peak memory, and the "
+        "cosine distance between their embeddings of the same faces."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backends", default=",".join(BACKEND_NAMES))
+        parser.add_argument("--images", default="", help="Folder of face crops (default: synthetic crops)")
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--batch-size", type=int, default=8)
+        parser.add_argument("--output", default="", help="Write the JSON report here as well")
+
+    def handle(self, *args, **options):
+        report = {"backends": {}}
+        spawn = multiprocessing.get_context("spawn")
+        for name in [b.strip() for b in options["backends"].split(",") if b.strip()]:
+            self.stderr.write(f"Benchmarking {name}...")
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                future = pool.submit(_measure, name, options["images"], options["iterations"], options["batch_size"])
+                try:
+                    report["backends"][name] = future.result()
+                except Exception as e:
+                    report["backends"][name] = {"error": str(e)}
+
+        # Parity: how far apart the backends' embeddings of the same faces are
+        measured = {
+            name: np.asarray(result.pop("reference_embeddings"), dtype=np.float32)
+            for name, result in report["backends"].items()
+            if "reference_embeddings" in result
+        }
+        if "deepface" in measured:
+            reference = measured["deepface"]
+            for name, embeddings in measured.items():
+                if name == "deepface":
+                    continue
+                cosine = np.sum(reference * embeddings, axis=1) / (
+                    np.linalg.norm(reference, axis=1) * np.linalg.norm(embeddings, axis=1) + 1e-10
+                )
+                report["backends"][name]["max_cosine_distance_vs_deepface"] = round(float(np.max(1.0 - cosine)), 6)
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        self.stdout.write(output)
@@ -0,0 +1,255 @@
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.face_backends import BACKEND_NAMES
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def _load_gallery(gallery_dir):
+    """
+    {person: [image paths]} for every person folder with at least two images
+    (one to enroll, the rest to probe with).
+    """
+    gallery = {}
+    for person in sorted(os.listdir(gallery_dir)):
+        folder = os.path.join(gallery_dir, person)
+        if not os.path.isdir(folder):
+            continue
+        images = sorted(
+            os.path.join(folder, name) for name in os.listdir(folder) if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if len(images) >= 2:
+            gallery[person] = images
+    return gallery
+
+
+def _write_synthetic_gallery(directory, people, images_per_person, seed=0):
+    """
+    Stand-in gallery: each identity is a smooth random 160x160 pattern and
+    each of its images a shifted, noisy, re-lit copy. Good for latency and
+    regression tracking; real accuracy needs real faces.
+    """
+    rng = np.random.default_rng(seed)
+    for p in range(people):
+        folder = os.path.join(directory, f"person_{p:03d}")
+        os.makedirs(folder, exist_ok=True)
+        base = cv2.resize(rng.integers(0, 256, size=(12, 12, 3), dtype=np.uint8), (176, 176), interpolation=cv2.INTER_CUBIC)
+        for i in range(images_per_person):
+            dx, dy = rng.integers(0, 16, size=2)
+            img = base[dy:dy + 160, dx:dx + 160].astype(np.float32)
+            img = img * rng.uniform(0.85, 1.15) + rng.normal(0, 8, size=img.shape)
+            cv2.imwrite(os.path.join(folder, f"{p:03d}_{i}.jpg"), np.clip(img, 0, 255).astype(np.uint8))
+
+
+def _percentiles(samples_ms):
+    if not samples_ms:
+        return None
+    return {
+        "p50": round(float(np.percentile(samples_ms, 50)), 2),
+        "p95": round(float(np.percentile(samples_ms, 95)), 2),
+        "p99": round(float(np.percentile(samples_ms, 99)), 2),
+        "count": len(samples_ms),
+    }
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+
+
+def _error_rates(genuine, impostor, threshold):
+    genuine, impostor = np.asarray(genuine), np.asarray(impostor)
+    return {
+        "far": round(float(np.mean(impostor <= threshold)), 4) if len(impostor) else None,
+        "frr": round(float(np.mean(genuine > threshold)), 4) if len(genuine) else None,
+        "genuine_pairs": int(len(genuine)),
+        "impostor_pairs": int(len(impostor)),
+    }
+
+
+def _run_backend(backend_name, gallery, cascade, threshold):
+    """
+    Runs in a fresh spawned process with FACE_INFERENCE_BACKEND set, so model
+    load and peak RSS belong to this backend alone.
+    """
+    # Model logs go to stderr so stdout stays pure JSON
+    sys.stdout = sys.stderr
+    os.environ["FACE_INFERENCE_BACKEND"] = backend_name
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "attendease.settings")
+    import django
+    django.setup()
+
+    from accounts.face_embeddings import MATCH_THRESHOLD, cosine_distances, detect_face, embed_faces
+    from accounts.face_index import FaceIndex
+    from accounts.face_models import load_models, model_status
+
+    started = time.perf_counter()
+    load_models()
+    load_seconds = time.perf_counter() - started
+
+    stages = {"decode": [], "detect": [], "embed": [], "search_1to1": [], "search_1toN": [], "end_to_end": []}
+
+    def embed_image(path):
+        t0 = time.perf_counter()
+        img = cv2.imread(path)
+        t1 = time.perf_counter()
+        face, _ = detect_face(img, cascade=cascade)
+        t2 = time.perf_counter()
+        vector = embed_faces([face])[0]
+        t3 = time.perf_counter()
+        stages["decode"].append((t1 - t0) * 1000.0)
+        stages["detect"].append((t2 - t1) * 1000.0)
+        stages["embed"].append((t3 - t2) * 1000.0)
+        return vector, face, (t3 - t0) * 1000.0
+
+    # First image of each person is the enrolled template, the rest are probes
+    enrolled, probes, failures = {}, [], 0
+    for person, paths in gallery.items():
+        for i, path in enumerate(paths):
+            try:
+                vector, face, elapsed_ms = embed_image(path)
+            except ValueError:
+                failures += 1
+                continue
+            if i == 0:
+                enrolled[person] = vector
+            else:
+                probes.append((person, vector, face, elapsed_ms))
+
+    people = sorted(enrolled)
+    probes = [probe for probe in probes if probe[0] in enrolled]
+    if not people or not probes:
+        return {"error": "No usable enrolled/probe images (no face detected)", "detection_failures": failures}
+
+    templates = np.vstack([enrolled[p] for p in people])
+    index = FaceIndex(templates, people)
+    effective = min(MATCH_THRESHOLD, threshold)
+
+    # 1:1 (recognize_logged_in_user): probe vs every template, claimed or not
+    genuine, impostor = [], []
+    # 1:N (recognize_face): top-1 index search over the whole gallery
+    correct, false_accepts, rejected = 0, 0, 0
+    for person, vector, _, elapsed_ms in probes:
+        t0 = time.perf_counter()
+        distances = cosine_distances(vector, templates)
+        t1 = time.perf_counter()
+        match = index.search(vector, k=1)
+        t2 = time.perf_counter()
+        stages["search_1to1"].append((t1 - t0) * 1000.0)
+        stages["search_1toN"].append((t2 - t1) * 1000.0)
+        stages["end_to_end"].append(elapsed_ms + (t2 - t1) * 1000.0)
+
+        for other, distance in zip(people, distances):
+            (genuine if other == person else impostor).append(float(distance))
+
+        label, distance = match[0]
+        if distance > effective:
+            rejected += 1
+        elif label == person:
+            correct += 1
+        else:
+            false_accepts += 1
+
+    # Batched embedding throughput (the service / classroom path)
+    crops = [face for _, _, face, _ in probes][:16]
+    t0 = time.perf_counter()
+    embed_faces(crops)
+    batch_seconds = time.perf_counter() - t0
+
+    return {
+        "load_seconds": round(load_seconds, 3),
+        "load_error": model_status()["error"],
+        "stages_ms": {stage: _percentiles(samples) for stage, samples in stages.items()},
+        "throughput": {
+            "sequential_probes_per_second": round(1000.0 * len(probes) / sum(stages["end_to_end"]), 2),
+            "batched_embeds_per_second": round(len(crops) / batch_seconds, 2),
+            "batch_size": len(crops),
+        },
+        "one_to_one": {
+            "at_threshold": {"threshold": threshold, **_error_rates(genuine, impostor, threshold)},
+            "at_effective_threshold": {"threshold": effective, **_error_rates(genuine, impostor, effective)},
+        },
+        "one_to_n": {
+            "threshold": effective,
+            "probes": len(probes),
+            "identification_rate": round(correct / len(probes), 4),
+            "false_accept_rate": round(false_accepts / len(probes), 4),
+            "false_reject_rate": round(rejected / len(probes), 4),
+        },
+        "detection_failures": failures,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks recognition over a face gallery (<dir>/<person>/*.jpg, or a "
+        "synthetic one): per-stage p50/p95/p99 latency, throughput, FAR/FRR for "
+        "1:1 and 1:N matching, and peak RSS, per inference backend, as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--gallery", default=os.path.join(settings.MEDIA_ROOT, "faces"))
+        parser.add_argument("--synthetic-people", type=int, default=0, help="Use a synthetic gallery of this many people")
+        parser.add_argument("--synthetic-images", type=int, default=4, help="Images per synthetic person")
+        parser.add_argument("--backends", default=",".join(BACKEND_NAMES))
+        parser.add_argument("--detectors", default=",".join(settings.FACE_DETECTOR_CASCADE),
+                            help="Detector cascade to use (synthetic galleries always use skip)")
+        parser.add_argument("--threshold", type=float, default=0.45)
+        parser.add_argument("--output", default="", help="Write the JSON report here as well")
+
+    def handle(self, *args, **options):
+        tmp_dir = None
+        gallery_dir = options["gallery"]
+        cascade = [stage.strip() for stage in options["detectors"].split(",") if stage.strip()]
+        if options["synthetic_people"]:
+            tmp_dir = tempfile.mkdtemp(prefix="face-benchmark-")
+            _write_synthetic_gallery(tmp_dir, options["synthetic_people"], max(2, options["synthetic_images"]))
+            gallery_dir, cascade = tmp_dir, ["skip"]
+
+        try:
+            gallery = _load_gallery(gallery_dir) if os.path.isdir(gallery_dir) else {}
+            if len(gallery) < 2:
+                raise CommandError(
+                    f"Need at least two people with two images each in {gallery_dir}; "
+                    "or pass --synthetic-people N."
+                )
+
+            report = {
+                "gallery": "synthetic" if tmp_dir else gallery_dir,
+                "people": len(gallery),
+                "images": sum(len(paths) for paths in gallery.values()),
+                "detectors": cascade,
+                "backends": {},
+            }
+            spawn = multiprocessing.get_context("spawn")
+            for name in [b.strip() for b in options["backends"].split(",") if b.strip()]:
+                self.stderr.write(f"Benchmarking {name}...")
+                with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                    future = pool.submit(_run_backend, name, gallery, cascade, options["threshold"])
+                    try:
+                        report["backends"][name] = future.result()
+                    except Exception as e:
+                        report["backends"][name] = {"error": str(e)}
+        finally:
+            if tmp_dir:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        self.stdout.write(output)
@@ -0,0 +1,37 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports DeepFace's Facenet (with its downloaded weights) to an ONNX file "
+        "for FACE_INFERENCE_BACKEND=onnx. Needs tensorflow and tf2onnx; run it "
+        "once on a machine that has them, then ship the .onnx file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=settings.FACE_ONNX_MODEL_PATH, help="Where to write the .onnx file")
+        parser.add_argument("--opset", type=int, default=13)
+
+    def handle(self, *args, **options):
+        try:
+            import tensorflow as tf
+            import tf2onnx
+        except ImportError as e:
+            raise CommandError(f"Exporting needs tensorflow and tf2onnx: {e}")
+
+        from deepface.modules import modeling
+        from accounts.face_backends import FACENET_INPUT_SIZE
+        from accounts.face_embeddings import MODEL_NAME
+
+        model = modeling.build_model(task="facial_recognition", model_name=MODEL_NAME).model
+        signature = (tf.TensorSpec((None, *FACENET_INPUT_SIZE, 3), tf.float32, name="input"),)
+
+        output = options["output"]
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        tmp_output = f"{output}.{os.getpid()}.tmp"
+        tf2onnx.convert.from_keras(model, input_signature=signature, opset=options["opset"], output_path=tmp_output)
+        os.replace(tmp_output, output)
+        self.stdout.write(self.style.SUCCESS(f"Exported {MODEL_NAME} to {output}"))
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.face_models import ensure_loaded
+from accounts.kiosk import kiosk_from_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Marks attendance from a fixed door camera. --source is an RTSP/MJPEG "
+        "URL, a webcam index or a video file; each person passing is tracked "
+        "and recognized once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", required=True, help="Stream URL, webcam index or video file")
+        parser.add_argument("--device", default="kiosk", help="Name of this camera, used in logs")
+        parser.add_argument("--max-seconds", type=float, default=None, help="Stop after this long")
+
+    def handle(self, *args, **options):
+        if not settings.FACE_SERVICE_SOCKET:
+            ensure_loaded()
+
+        kiosk = kiosk_from_settings(options["source"], options["device"])
+        try:
+            kiosk.run(max_seconds=options["max_seconds"])
+        except ValueError as e:
+            raise CommandError(str(e))
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.face_service import RecognitionService
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the face recognition service on a local Unix socket. It loads the "
+        "models once and embeds frames from all web workers in small batches. "
+        "Point web workers at it with FACE_SERVICE_SOCKET."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--socket", default=settings.FACE_SERVICE_SOCKET, help="Unix socket path to listen on")
+        parser.add_argument("--max-batch", type=int, default=settings.FACE_SERVICE_MAX_BATCH)
+        parser.add_argument("--max-wait-ms", type=int, default=settings.FACE_SERVICE_MAX_WAIT_MS)
+
+    def handle(self, *args, **options):
+        if not options["socket"]:
+            raise CommandError("Set FACE_SERVICE_SOCKET or pass --socket.")
+
+        service = RecognitionService(
+            options["socket"],
+            max_batch=options["max_batch"],
+            max_wait_ms=options["max_wait_ms"],
+        )
+        service.serve_forever()
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0020_masteruserrecord_uploaded_by_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassRoster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('faculty', models.ForeignKey(limit_choices_to={'user_type': 'faculty'}, on_delete=django.db.models.deletion.CASCADE, related_name='rosters', to=settings.AUTH_USER_MODEL)),
+                ('students', models.ManyToManyField(blank=True, limit_choices_to={'user_type': 'student'}, related_name='class_rosters', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:02
+
+import hashlib
+import os
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def catalogue_existing_faces(apps, schema_editor):
+    """
+    Catalogues the images already in media/faces/<username>/ so recognition
+    keeps working without a directory listing.
+    """
+    FaceTemplate = apps.get_model('accounts', 'FaceTemplate')
+    face_db = os.path.join(settings.MEDIA_ROOT, 'faces')
+    if not os.path.isdir(face_db):
+        return
+
+    for username in sorted(os.listdir(face_db)):
+        user_folder = os.path.join(face_db, username)
+        if not os.path.isdir(user_folder):
+            continue
+        taken = set()
+        for img_name in sorted(os.listdir(user_folder)):
+            if not img_name.lower().endswith(('.jpg', '.jpeg', '.png')):
+                continue
+            path = os.path.join(user_folder, img_name)
+            with open(path, 'rb') as f:
+                content_hash = hashlib.sha256(f.read()).hexdigest()
+            match = re.fullmatch(re.escape(username) + r'_(\d+)\.(jpe?g|png)', img_name, re.IGNORECASE)
+            sequence = int(match.group(1)) if match else None
+            if sequence in taken:
+                sequence = None
+            taken.add(sequence)
+            FaceTemplate.objects.create(
+                username=username,
+                image_path=f'faces/{username}/{img_name}',
+                sequence=sequence,
+                content_hash=content_hash,
+                source='backfill',
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0021_classroster'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaceTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(db_index=True, max_length=150)),
+                ('image_path', models.CharField(max_length=255, unique=True)),
+                ('sequence', models.PositiveIntegerField(blank=True, null=True)),
+                ('content_hash', models.CharField(blank=True, max_length=64)),
+                ('embedding_key', models.CharField(blank=True, max_length=255)),
+                ('source', models.CharField(choices=[('enrollment', 'Enrollment'), ('face_update', 'Face Update'), ('admin_approval', 'Admin Approval'), ('master_upload', 'Master Upload'), ('backfill', 'Backfill')], default='enrollment', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['username', 'created_at'],
+                'unique_together': {('username', 'sequence')},
+            },
+        ),
+        migrations.RunPython(catalogue_existing_faces, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0022_facetemplate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GalleryEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(max_length=150)),
+                ('source', models.CharField(choices=[('enrollment', 'Enrollment'), ('face_update', 'Face Update'), ('admin_approval', 'Admin Approval'), ('master_upload', 'Master Upload'), ('backfill', 'Backfill'), ('removal', 'Removal')], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
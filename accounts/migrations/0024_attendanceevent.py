@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0023_galleryevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('kind', models.CharField(choices=[('scan', 'Face Scan'), ('check_in', 'Check-In'), ('check_out', 'Check-Out')], default='scan', max_length=10)),
+                ('device', models.CharField(default='web', max_length=64)),
+                ('distance', models.FloatField(blank=True, null=True)),
+                ('projected', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('projected', False)), fields=['id'], name='attendance_event_pending')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'timestamp'), name='unique_attendance_event')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0024_attendanceevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='absences_filled_through',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
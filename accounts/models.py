@@ -16,6 +16,8 @@ class CustomUser(AbstractUser):
     )
     is_approved = models.BooleanField(default=False)  #For check wheather the user is approved or not
     has_face_data = models.BooleanField(default=False)  
+    # Last day auto_mark_absent has filled in; later visits only fill the days after it
+    absences_filled_through = models.DateField(null=True, blank=True)
 
 class PendingFaceUpdate(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
@@ -110,4 +112,105 @@ class MasterUserRecord(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"{self.username} ({self.enrollment_no})"
\ No newline at end of file
+        return f"{self.username} ({self.enrollment_no})"
+
+class ClassRoster(models.Model):
+    name = models.CharField(max_length=100)
+    faculty = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="rosters",
+        limit_choices_to={"user_type": "faculty"},
+    )
+    students = models.ManyToManyField(
+        settings.AUTH_USER_MODEL,
+        related_name="class_rosters",
+        limit_choices_to={"user_type": "student"},
+        blank=True,
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.faculty.username})"
+
+
+class FaceTemplate(models.Model):
+    """
+    Catalogue of approved face images. Keyed by username, like the faces/
+    folders and the embedding store, because master uploads exist before the
+    student registers.
+    """
+    SOURCE_CHOICES = [
+        ("enrollment", "Enrollment"),
+        ("face_update", "Face Update"),
+        ("admin_approval", "Admin Approval"),
+        ("master_upload", "Master Upload"),
+        ("backfill", "Backfill"),
+    ]
+
+    username = models.CharField(max_length=150, db_index=True)
+    image_path = models.CharField(max_length=255, unique=True)  # relative to MEDIA_ROOT
+    sequence = models.PositiveIntegerField(null=True, blank=True)  # N of <username>_N.jpg
+    content_hash = models.CharField(max_length=64, blank=True)
+    embedding_key = models.CharField(max_length=255, blank=True)  # entry in the embedding cache
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default="enrollment")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("username", "sequence")
+        ordering = ["username", "created_at"]
+
+    def __str__(self):
+        return f"{self.username} - {self.image_path}"
+
+
+class GalleryEvent(models.Model):
+    """
+    One change to a user's enrolled faces. The auto-increment id is the
+    gallery generation: workers apply events newer than the generation
+    they hold instead of rebuilding the whole index.
+    """
+    SOURCE_CHOICES = FaceTemplate.SOURCE_CHOICES + [("removal", "Removal")]
+
+    username = models.CharField(max_length=150)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"#{self.id} {self.username} ({self.source})"
+
+
+class AttendanceEvent(models.Model):
+    """
+    Append-only log of attendance scans. Recording a scan is one INSERT;
+    Attendance is the daily projection of this log, folded in by
+    attendance_log.project_pending, which flips `projected` on the rows it used.
+    """
+    KIND_CHOICES = [
+        ("scan", "Face Scan"),  # first of the day checks in, the next checks out
+        ("check_in", "Check-In"),
+        ("check_out", "Check-Out"),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False)
+    timestamp = models.DateTimeField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default="scan")
+    device = models.CharField(max_length=64, default="web")
+    distance = models.FloatField(null=True, blank=True)  # match distance, when from recognition
+    projected = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ["id"]
+        constraints = [
+            # Also the (user, timestamp) lookup index; makes journal replays idempotent
+            models.UniqueConstraint(fields=["user", "timestamp"], name="unique_attendance_event"),
+        ]
+        indexes = [
+            models.Index(fields=["id"], condition=models.Q(projected=False), name="attendance_event_pending"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.timestamp:%Y-%m-%d %H:%M:%S} ({self.kind})"
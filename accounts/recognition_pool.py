@@ -0,0 +1,202 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from django.conf import settings
+
+
+# -----------------------------
+# Errors surfaced to the views
+# -----------------------------
+class RecognitionBusy(Exception):
+    """All recognition slots are taken; the caller should retry later."""
+
+
+class RecognitionTimeout(Exception):
+    """Recognition did not finish within the per-request deadline."""
+
+
+# -----------------------------
+# Bounded Executor
+# -----------------------------
+# Slots cap running + queued jobs for this web worker. A request that cannot
+# get a slot is rejected at once instead of queueing behind a scan burst.
+_lock = threading.Lock()
+_executor = None
+_slots = None
+_warmups = []
+_stats = {
+    "submitted": 0,
+    "completed": 0,
+    "rejected": 0,
+    "timed_out": 0,
+    "in_flight": 0,
+    "last_wait_ms": 0.0,
+    "max_wait_ms": 0.0,
+    "total_wait_ms": 0.0,
+}
+
+
+POOL_WORKER_ENV = "FACE_POOL_WORKER"
+
+
+def _init_process_worker():
+    """
+    Runs once in each spawned pool process: set up Django, then warm the
+    models so the first scan routed here does not pay the build.
+    """
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "attendease.settings")
+    # Tells AccountsConfig.ready() not to start a pool (or a flusher) of its own
+    os.environ[POOL_WORKER_ENV] = "1"
+    import django
+    django.setup()
+
+    from django.conf import settings as worker_settings
+    if not worker_settings.FACE_SERVICE_SOCKET:
+        from .face_models import load_models
+        load_models()
+
+
+def _warm_status():
+    from .face_models import model_status
+    return model_status()
+
+
+def _get_executor():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            workers = settings.FACE_EXECUTOR_WORKERS
+            if settings.FACE_EXECUTOR == "process":
+                # spawn, not fork: TensorFlow state does not survive a fork
+                _executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_process_worker,
+                )
+                # Readiness probes, whether the pool was started up front or by the first scan
+                _warmups[:] = [_executor.submit(_warm_status) for _ in range(workers)]
+            else:
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="face-recognition")
+            _slots = threading.BoundedSemaphore(workers + settings.FACE_EXECUTOR_QUEUE)
+        return _executor
+
+
+def start_pool():
+    """
+    Starts the pool processes up front (called at worker startup); each one
+    warms its models in the initializer before reporting back.
+    """
+    _get_executor()
+
+
+def worker_model_status():
+    """
+    Readiness of whatever runs recognition for this web worker: the shared
+    service, the pool processes, or the models in this process.
+    """
+    from .face_models import model_status
+    from .face_service import service_status
+
+    if settings.FACE_SERVICE_SOCKET:
+        return service_status()
+    if settings.FACE_EXECUTOR != "process":
+        return model_status()
+    if not _warmups:
+        # Without FACE_MODEL_WARMUP nothing has started the pool: a probe does,
+        # so the worker can become ready before it is sent any traffic
+        _get_executor()
+        return {"status": "loading"}
+    if not all(future.done() for future in _warmups):
+        return {"status": "loading"}
+
+    errors = [str(future.exception()) for future in _warmups if future.exception()]
+    states = [future.result() for future in _warmups if not future.exception()]
+    if errors or any(state["status"] != "ready" for state in states):
+        return {"status": "error", "error": errors or [state["error"] for state in states]}
+    return {**states[0], "processes": len(states)}
+
+
+def _timed_call(fn, submitted_at, args, kwargs):
+    wait_ms = (time.time() - submitted_at) * 1000.0
+    return fn(*args, **kwargs), wait_ms
+
+
+def _release(future):
+    _slots.release()
+    with _lock:
+        _stats["in_flight"] -= 1
+        if not future.cancelled() and future.exception() is None:
+            wait_ms = future.result()[1]
+            _stats["completed"] += 1
+            _stats["last_wait_ms"] = round(wait_ms, 2)
+            _stats["max_wait_ms"] = round(max(_stats["max_wait_ms"], wait_ms), 2)
+            _stats["total_wait_ms"] += wait_ms
+
+
+def _submit(fn, args, kwargs):
+    executor = _get_executor()
+    if not _slots.acquire(blocking=False):
+        with _lock:
+            _stats["rejected"] += 1
+        raise RecognitionBusy()
+
+    with _lock:
+        _stats["submitted"] += 1
+        _stats["in_flight"] += 1
+    future = executor.submit(_timed_call, fn, time.time(), args, kwargs)
+    future.add_done_callback(_release)
+    return future
+
+
+def _timed_out(future):
+    # A running job cannot be interrupted; it keeps its slot until it ends
+    future.cancel()
+    with _lock:
+        _stats["timed_out"] += 1
+    return RecognitionTimeout()
+
+
+def run_recognition(fn, *args, **kwargs):
+    """
+    Runs fn(*args, **kwargs) on the bounded executor and waits at most
+    settings.FACE_RECOGNITION_DEADLINE seconds for it.
+    Raises RecognitionBusy when no slot is free, RecognitionTimeout on deadline.
+    fn must be a module-level function when the process pool is used.
+    """
+    future = _submit(fn, args, kwargs)
+    try:
+        return future.result(timeout=settings.FACE_RECOGNITION_DEADLINE)[0]
+    except FutureTimeout:
+        raise _timed_out(future)
+
+
+async def run_recognition_async(fn, *args, **kwargs):
+    """
+    run_recognition for async views: the request awaits the executor future
+    instead of blocking a thread, so one ASGI worker can hold many scans
+    that are waiting on inference. Same slots, deadline and errors.
+    """
+    future = _submit(fn, args, kwargs)
+    try:
+        return (await asyncio.wait_for(asyncio.wrap_future(future), settings.FACE_RECOGNITION_DEADLINE))[0]
+    except asyncio.TimeoutError:
+        raise _timed_out(future)
+
+
+def recognition_stats():
+    """
+    Queue depth and wait times for this web worker, for the health endpoint.
+    """
+    with _lock:
+        stats = dict(_stats)
+    total_wait_ms = stats.pop("total_wait_ms")
+    stats["avg_wait_ms"] = round(total_wait_ms / stats["completed"], 2) if stats["completed"] else 0.0
+    stats["executor"] = settings.FACE_EXECUTOR
+    stats["workers"] = settings.FACE_EXECUTOR_WORKERS
+    stats["queue_limit"] = settings.FACE_EXECUTOR_QUEUE
+    return stats
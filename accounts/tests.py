@@ -1,3 +1,1006 @@
-from django.test import TestCase
+import base64
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import cv2
+import numpy as np
+from django.conf import settings
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import (
+    face_backends,
+    face_embeddings,
+    face_index,
+    face_models,
+    face_scan_bulk,
+    face_system,
+    face_templates,
+    recognition_pool,
+)
+from .admin import FaceChangeRequestAdmin
+from .attendance_buffer import AttendanceBuffer
+from .cooldown import aremember_result, get_recent_result, remember_result
+from .face_backends import DeepFaceBackend, OnnxFacenetBackend, preprocess_face
+from .face_index import FaceIndex, load_snapshot, publish_snapshot, read_snapshot_header
+from .face_service import RecognitionService, recv_message, send_message
+from .face_system import check_frame_quality, decode_request_image
+from .kiosk import KioskStream
+from .management.commands import benchmark_recognition
+from .attendance_log import project_pending, record_event
+from .embedding_cache import EmbeddingCache, file_sha256
+from .models import Attendance, AttendanceEvent, ClassRoster, CustomUser, FaceChangeRequest, FaceTemplate, GalleryEvent, UserFace
+from .recognition_pool import recognition_stats, worker_model_status
+from .utils import mark_roster_attendance, mark_user_attendance
+from .views import auto_mark_absent
+
+FACENET_WEIGHTS = os.path.join(settings.DEEPFACE_HOME, ".deepface", "weights", "facenet_weights.h5")
+
+
+def _sample_faces():
+    rng = np.random.default_rng(7)
+    # Square, tall and wide crops, like the different detectors return
+    return [rng.integers(0, 256, size=shape, dtype=np.uint8) for shape in ((160, 160, 3), (210, 150, 3), (97, 131, 3))]
+
+
+class FacenetBackendParityTests(SimpleTestCase):
+    def test_preprocessing_matches_deepface(self):
+        try:
+            from deepface.modules import preprocessing
+        except ImportError:
+            self.skipTest("deepface is not installed")
+
+        for face in _sample_faces():
+            # DeepFace.represent(detector_backend="skip") feeds the model BGR, resized and scaled
+            expected = preprocessing.resize_image(img=face, target_size=(160, 160))
+            expected = preprocessing.normalize_input(img=expected, normalization="base")
+            np.testing.assert_allclose(preprocess_face(face), expected, atol=1e-6)
+
+    @unittest.skipUnless(
+        os.path.exists(settings.FACE_ONNX_MODEL_PATH) and os.path.exists(FACENET_WEIGHTS),
+        "needs the exported ONNX model and DeepFace's Facenet weights",
+    )
+    def test_onnx_embeddings_match_deepface(self):
+        faces = _sample_faces()
+        reference = DeepFaceBackend().embed(faces)
+        embeddings = OnnxFacenetBackend(settings.FACE_ONNX_MODEL_PATH).embed(faces)
+
+        self.assertEqual(embeddings.shape, reference.shape)
+        cosine = np.sum(reference * embeddings, axis=1) / (
+            np.linalg.norm(reference, axis=1) * np.linalg.norm(embeddings, axis=1)
+        )
+        # Far below the 0.40 match threshold, so stored TF embeddings stay valid
+        self.assertLess(float(np.max(1.0 - cosine)), 1e-4)
+
+
+@override_settings(FACE_DETECTOR_CASCADE=["skip", "opencv", "mtcnn"])
+class ModelRegistryTests(SimpleTestCase):
+    def setUp(self):
+        from deepface import DeepFace
+        from deepface.modules import modeling
+
+        self.enterContext(mock.patch.dict(face_models._state, {"status": "cold", "error": None}))
+        self.backend = mock.Mock()
+        self.backend.name = "fake"
+        self.enterContext(mock.patch.object(face_backends, "get_backend", return_value=self.backend))
+        self.build_model = self.enterContext(mock.patch.object(modeling, "build_model"))
+        self.enterContext(mock.patch.object(DeepFace, "extract_faces"))
+
+    def test_models_are_built_once_per_process(self):
+        self.assertTrue(face_models.load_models())
+        self.assertTrue(face_models.load_models())
+        face_models.ensure_loaded()
+
+        self.backend.load.assert_called_once()
+        self.backend.embed.assert_called_once()
+        detectors = [call.kwargs["model_name"] for call in self.build_model.call_args_list]
+        self.assertEqual(detectors, ["mtcnn", "opencv"])
+        status = face_models.model_status()
+        self.assertEqual((status["status"], status["backend"], status["detector"]), ("ready", "fake", "mtcnn,opencv"))
+
+    def test_failed_warmup_is_reported(self):
+        self.backend.embed.side_effect = RuntimeError("no weights")
+        self.assertFalse(face_models.load_models())
+        self.assertFalse(face_models.is_ready())
+        self.assertEqual(face_models.model_status()["error"], "no weights")
+
+
+@override_settings(ATTENDANCE_PROJECTION_MS=0)
+class AttendanceWriteRaceTests(TransactionTestCase):
+    def test_concurrent_scans_check_in_once_and_out_once(self):
+        user = CustomUser.objects.create_user(username="race", password="x")
+        scans = 6
+        barrier = threading.Barrier(scans)
+        actions, errors = [], []
+
+        def scan():
+            try:
+                barrier.wait()
+                actions.append(mark_user_attendance(user)[0])
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=scan) for _ in range(scans)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(actions), ["check_in", "check_out"] + ["completed"] * (scans - 2))
+        self.assertEqual(AttendanceEvent.objects.filter(user=user).count(), scans)
+
+        # Attendance is the projection of the log
+        project_pending()
+        attendance = Attendance.objects.get(user=user)
+        self.assertIsNotNone(attendance.check_in)
+        self.assertIsNotNone(attendance.check_out)
+        self.assertEqual(attendance.status, "Present")
+
+    def test_scan_waits_for_an_uncommitted_earlier_scan(self):
+        # Postgres hands out ids before commit: a scan with a lower id can
+        # still be in flight when a later one reads the log
+        user = CustomUser.objects.create_user(username="inflight", password="x")
+        started, outcome = threading.Event(), []
+
+        def earlier_scan():
+            try:
+                with transaction.atomic():
+                    CustomUser.objects.select_for_update().get(pk=user.pk)
+                    record_event(user)
+                    started.set()
+                    time.sleep(0.5)
+            finally:
+                started.set()
+                connection.close()
+
+        def later_scan():
+            try:
+                started.wait()
+                outcome.append(mark_user_attendance(user)[0])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=earlier_scan), threading.Thread(target=later_scan)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcome, ["check_out"])
+
+
+class IsolatedMediaMixin:
+    """
+    Points MEDIA_ROOT and the media-backed module paths at a throwaway
+    directory for the duration of each test.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp(prefix="attendease-test-")
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media))
+        faces = os.path.join(self.media, "faces")
+        embeddings = os.path.join(self.media, "embeddings")
+        os.makedirs(embeddings)
+        self.enterContext(mock.patch.object(face_templates, "FACE_DB", faces))
+        self.enterContext(mock.patch.object(face_embeddings, "FACE_DB", faces))
+        self.enterContext(mock.patch.object(face_embeddings, "EMBEDDINGS_DB", embeddings))
+
+    def write_image(self, path, seed=0):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        cv2.imwrite(path, np.random.default_rng(seed).integers(0, 256, size=(32, 32, 3), dtype=np.uint8))
+        return path
+
+
+@override_settings(FACE_MAX_TEMPLATES_PER_USER=5)
+class TemplatePruningTests(IsolatedMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user(username="stu", password="x")
+        rng = np.random.default_rng(3)
+        self.vectors = {f"stu_{n}.jpg": rng.normal(size=128).astype(np.float32) for n in range(1, 6)}
+        # The approved capture is a near-duplicate of the current profile image
+        self.vectors["stu_6.jpg"] = self.vectors["stu_1.jpg"] + rng.normal(scale=0.01, size=128).astype(np.float32)
+        self.enterContext(mock.patch.object(face_embeddings, "embed_stored_image", self.fake_embed))
+
+        for n in range(1, 6):
+            path = face_templates.add_numbered_template("stu", "test", img=np.full((32, 32, 3), n, np.uint8))
+            face_embeddings.add_user_embedding("stu", path)
+        UserFace.objects.create(user=self.user, face_image="faces/stu/stu_1.jpg")
+
+    def fake_embed(self, img_path, img=None, content_hash=None):
+        return self.vectors[os.path.basename(img_path)], os.path.basename(img_path)
+
+    def test_approved_near_duplicate_survives_pruning(self):
+        new_face = self.write_image(os.path.join(self.media, "pending", "stu_new.jpg"))
+        change = FaceChangeRequest.objects.create(user=self.user, new_face_path=new_face)
+
+        model_admin = FaceChangeRequestAdmin(FaceChangeRequest, admin.site)
+        with mock.patch.object(model_admin, "message_user"):
+            model_admin.approve_request(None, FaceChangeRequest.objects.filter(pk=change.pk))
+
+        face_image = UserFace.objects.get(user=self.user).face_image.name
+        self.assertEqual(face_image, "faces/stu/stu_6.jpg")
+        self.assertTrue(os.path.exists(os.path.join(self.media, face_image)))
+        names, _ = face_embeddings.load_user_embeddings("stu")
+        self.assertEqual(len(names), 5)
+        self.assertIn("stu_6.jpg", names)
+        # The redundant twin it replaced is the one dropped
+        self.assertNotIn("stu_1.jpg", names)
+
+
+class StoredGalleryMatchTests(IsolatedMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(5)
+        self.face = rng.normal(size=128).astype(np.float32)
+        self.vectors = {}
+        self.enterContext(mock.patch.object(face_embeddings, "embed_stored_image", self.fake_embed))
+        for n in range(3):
+            path = face_templates.add_numbered_template("stu", "test", img=np.full((32, 32, 3), n, np.uint8))
+            self.vectors[os.path.basename(path)] = self.face + rng.normal(scale=0.05, size=128).astype(np.float32)
+            face_embeddings.add_user_embedding("stu", path)
+
+    def fake_embed(self, img_path, img=None, content_hash=None):
+        return self.vectors[os.path.basename(img_path)], os.path.basename(img_path)
+
+    def scan(self, live_vector, username="stu"):
+        with mock.patch.object(face_system, "represent_live_face", return_value=(live_vector, "opencv")) as represent:
+            return face_system.match_logged_in_user(np.zeros((8, 8, 3), np.uint8), username), represent
+
+    def test_scan_matches_the_persisted_embeddings(self):
+        names, vectors = face_embeddings.load_user_embeddings("stu")
+        self.assertEqual(sorted(names), ["stu_1.jpg", "stu_2.jpg", "stu_3.jpg"])
+        self.assertEqual(vectors.shape, (3, 128))
+
+        result, _ = self.scan(self.face)
+        self.assertEqual(result["username"], "stu")
+        self.assertEqual(result["detector"], "opencv")
+        self.assertLess(result["distance"], face_embeddings.MATCH_THRESHOLD)
+
+    def test_someone_else_is_rejected(self):
+        stranger = np.random.default_rng(6).normal(size=128).astype(np.float32)
+        result, _ = self.scan(stranger)
+        self.assertIsNone(result["username"])
+        self.assertGreater(result["distance"], face_embeddings.MATCH_THRESHOLD)
+
+    def test_user_without_images_is_not_embedded(self):
+        result, represent = self.scan(self.face, username="nobody")
+        self.assertIsNone(result["username"])
+        represent.assert_not_called()
+
+
+class AlignedCropTests(IsolatedMediaMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.enterContext(mock.patch.object(face_embeddings, "CROPS_DB", os.path.join(self.media, "face_crops")))
+        self.enterContext(mock.patch.object(face_embeddings, "ensure_loaded"))
+        self.face = np.random.default_rng(4).integers(0, 256, size=(210, 150, 3), dtype=np.uint8)
+
+    def test_stored_image_is_detected_once(self):
+        path = self.write_image(os.path.join(self.media, "faces", "stu", "stu_1.jpg"))
+        with mock.patch.object(face_embeddings, "detect_face", return_value=(self.face, "mtcnn")) as detect:
+            crop = face_embeddings.stored_face_crop(path, file_sha256(path))
+            again = face_embeddings.stored_face_crop(path, file_sha256(path))
+
+        detect.assert_called_once()
+        self.assertEqual(crop.shape, (160, 160, 3))
+        # Stored losslessly, so re-embedding the crop gives the same vector
+        np.testing.assert_array_equal(crop, again)
+
+    def test_crop_is_embedded_without_a_detector(self):
+        with mock.patch.object(face_embeddings, "detect_face") as detect, \
+                mock.patch.object(face_embeddings, "embed_faces", return_value=np.ones((1, 128), np.float32)) as embed:
+            face_embeddings.represent_crop(np.zeros((160, 160, 3), np.uint8))
+        detect.assert_not_called()
+        self.assertEqual(embed.call_args.args[0][0].shape, (160, 160, 3))
+
+
+class AttendanceJournalReplayTests(TestCase):
+    def setUp(self):
+        self.journal_dir = tempfile.mkdtemp(prefix="attendease-journal-")
+        self.addCleanup(shutil.rmtree, self.journal_dir, ignore_errors=True)
+        self.user = CustomUser.objects.create_user(username="journal", password="x")
+
+    def test_scans_journaled_by_another_worker_are_counted(self):
+        first, second = AttendanceBuffer(journal_dir=self.journal_dir), AttendanceBuffer(journal_dir=self.journal_dir)
+
+        self.assertEqual(first.record(self.user)[0], "check_in")
+        self.assertEqual(second.record(self.user)[0], "check_out")
+        self.assertEqual(first.record(self.user)[0], "completed")
+
+        self.assertEqual(second.flush(), 2)
+        self.assertEqual(AttendanceEvent.objects.filter(user=self.user).count(), 2)
+        # Once flushed, the event log alone decides
+        self.assertEqual(first.record(self.user)[0], "completed")
+
+    def test_crashed_workers_shard_is_flushed(self):
+        crashed_at = timezone.now() - timedelta(minutes=5)
+        scan = {"user_id": self.user.id, "timestamp": crashed_at.isoformat(), "device": "crashed"}
+        with open(os.path.join(self.journal_dir, f"shard-{self.user.id % 64}.jsonl"), "w") as f:
+            f.write(json.dumps(scan) + "\n" + '{"user_id": ')  # torn by the crash
+
+        buffer = AttendanceBuffer(journal_dir=self.journal_dir)
+        self.assertEqual(buffer.record(self.user, device="new")[0], "check_out")
+        self.assertEqual(buffer.flush(), 2)
+
+        devices = sorted(AttendanceEvent.objects.filter(user=self.user).values_list("device", flat=True))
+        self.assertEqual(devices, ["crashed", "new"])
+        self.assertEqual(buffer.status()["pending"], 0)
+
+
+@override_settings(ATTENDANCE_PROJECTION_MS=0)
+class AttendanceProjectionTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username="projection", password="x")
+
+    def test_nothing_pending_takes_no_lock(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(project_pending(), 0)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("FOR UPDATE", queries[0]["sql"])
+
+    def test_conflicting_insert_is_retried_on_the_next_pass(self):
+        record_event(self.user)
+        with mock.patch.object(Attendance.objects, "bulk_create", side_effect=IntegrityError):
+            self.assertEqual(project_pending(), 0)
+        self.assertTrue(AttendanceEvent.objects.filter(projected=False).exists())
+
+        self.assertEqual(project_pending(), 1)
+        self.assertEqual(Attendance.objects.get(user=self.user).status, "Checked In")
+
+
+class DecodeRequestImageTests(SimpleTestCase):
+    def post_json(self, payload):
+        return RequestFactory().post("/", data=json.dumps(payload), content_type="application/json")
+
+    def test_legacy_data_url_is_decoded(self):
+        _, jpeg = cv2.imencode(".jpg", np.zeros((8, 8, 3), np.uint8))
+        data_url = "data:image/jpeg;base64," + base64.b64encode(jpeg.tobytes()).decode()
+        self.assertEqual(decode_request_image(self.post_json({"image_data": data_url})).shape, (8, 8, 3))
+
+    def test_malformed_data_url_reads_as_no_image(self):
+        for image_data in ("no-comma-here", "data:image/jpeg;base64,@@@", 42):
+            self.assertIsNone(decode_request_image(self.post_json({"image_data": image_data})))
+
+
+class FaceIndexSearchTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        self.people = [f"user{i:02d}" for i in range(40)]
+        centres = rng.normal(size=(len(self.people), 128)).astype(np.float32)
+        # Three templates per person, scattered around their centre
+        self.vectors = np.vstack([centre + rng.normal(scale=0.05, size=(3, 128)) for centre in centres])
+        self.labels = [person for person in self.people for _ in range(3)]
+        self.probes = centres + rng.normal(scale=0.05, size=centres.shape)
+
+    def brute_force(self, probe):
+        unit = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        distances = 1.0 - unit @ (probe / np.linalg.norm(probe))
+        best = {}
+        for label, distance in zip(self.labels, distances):
+            best[label] = min(best.get(label, np.inf), distance)
+        return sorted(best.items(), key=lambda item: item[1])
+
+    def test_exact_search_matches_brute_force(self):
+        index = FaceIndex(self.vectors, self.labels)
+        for probe in self.probes:
+            expected = self.brute_force(probe)[:5]
+            results = index.search(probe, k=5)
+            self.assertEqual([label for label, _ in results], [label for label, _ in expected])
+            np.testing.assert_allclose([d for _, d in results], [d for _, d in expected], atol=1e-5)
+
+    def test_one_result_per_user(self):
+        results = FaceIndex(self.vectors, self.labels).search(self.probes[0], k=10)
+        self.assertEqual(len({label for label, _ in results}), 10)
+
+    def test_ivf_finds_the_same_top_match(self):
+        index = FaceIndex(self.vectors, self.labels, nlist=8, nprobe=3)
+        self.assertEqual(len(index.centroids), 8)
+        for person, probe in zip(self.people, self.probes):
+            self.assertEqual(index.search(probe, k=1)[0][0], person)
+
+    def test_ivf_probe_of_empty_lists_returns_nothing(self):
+        index = FaceIndex(self.vectors, self.labels, nlist=8, nprobe=1)
+        # An extra, unused list whose centroid is exactly the probe's direction
+        probe = self.probes[0] / np.linalg.norm(self.probes[0])
+        index.centroids = np.vstack([index.centroids, probe]).astype(np.float32)
+        index.offsets = np.append(index.offsets, index.offsets[-1])
+        self.assertEqual(len(index._candidate_scores(probe)[1]), 0)
+        self.assertEqual(index.search(probe, k=3), [])
+
+    def test_euclidean_metric_and_exclusions(self):
+        index = FaceIndex(self.vectors, self.labels)
+        (label, cosine), = index.search(self.probes[0], k=1)
+        (_, euclidean), = index.search(self.probes[0], k=1, metric="euclidean_l2")
+        self.assertAlmostEqual(euclidean, np.sqrt(2.0 * cosine), places=5)
+        self.assertNotEqual(index.search(self.probes[0], k=1, exclude={label})[0][0], label)
+        self.assertEqual(FaceIndex(np.empty((0, 0), np.float32), []).search(self.probes[0]), [])
+
+
+@override_settings(FACE_DETECTOR_CASCADE=["skip", "opencv", "mtcnn"])
+class DetectorCascadeTests(SimpleTestCase):
+    def setUp(self):
+        from deepface import DeepFace
+
+        self.extract = self.enterContext(mock.patch.object(DeepFace, "extract_faces"))
+
+    def detected(self, *sizes):
+        return [
+            {"face": np.full((side, side, 3), side, np.uint8), "facial_area": {"w": side, "h": side}}
+            for side in sizes
+        ]
+
+    def test_prealigned_crop_skips_detection(self):
+        crop = np.zeros((160, 160, 3), np.uint8)
+        face, stage = face_embeddings.detect_face(crop)
+        self.assertIs(face, crop)
+        self.assertEqual(stage, "skip")
+        self.extract.assert_not_called()
+
+    def test_falls_through_to_the_first_stage_that_finds_a_face(self):
+        def extract(img, detector_backend, **kwargs):
+            if detector_backend == "opencv":
+                raise ValueError("Face could not be detected")
+            return self.detected(40, 90, 60)
+
+        self.extract.side_effect = extract
+        face, stage = face_embeddings.detect_face(np.zeros((480, 640, 3), np.uint8))
+        self.assertEqual(stage, "mtcnn")
+        self.assertEqual(face.shape, (90, 90, 3))
+        self.assertEqual([call.kwargs["detector_backend"] for call in self.extract.call_args_list], ["opencv", "mtcnn"])
+
+    def test_no_stage_finds_a_face(self):
+        self.extract.side_effect = ValueError("Face could not be detected")
+        with self.assertRaises(ValueError):
+            face_embeddings.detect_face(np.zeros((480, 640, 3), np.uint8))
+
+
+class RecognitionServiceTests(SimpleTestCase):
+    def test_concurrent_frames_share_one_forward_pass(self):
+        service = RecognitionService("unused.sock", max_batch=8, max_wait_ms=5)
+        frames = [np.full((160, 160, 3), n, np.uint8) for n in range(3)]
+        futures = [service.submit(frame, "live") for frame in frames]
+        blurry = service.submit(np.zeros((480, 640, 3), np.uint8), "live")
+        aligned = service.submit(np.full((160, 160, 3), 9, np.uint8), "aligned")
+
+        def detect(img, cascade=None):
+            if img.shape != (160, 160, 3):
+                raise ValueError("Face could not be detected")
+            return img, "skip"
+
+        def embed(crops):
+            return np.array([[float(crop[0, 0, 0])] * 4 for crop in crops], np.float32)
+
+        with mock.patch.object(face_embeddings, "detect_face", side_effect=detect), \
+                mock.patch.object(face_embeddings, "embed_faces", side_effect=embed) as embed_faces:
+            service._run_batch(service._collect_batch())
+
+        embed_faces.assert_called_once()
+        self.assertEqual((service.batches, service.frames), (1, 4))
+        for n, future in enumerate(futures):
+            embedding, stage = future.result(timeout=1)
+            self.assertEqual((float(embedding[0]), stage), (n, "skip"))
+        self.assertEqual(aligned.result(timeout=1)[1], "aligned")
+        with self.assertRaises(ValueError):
+            blurry.result(timeout=1)
+
+    def test_frames_cross_the_socket_as_raw_pixels(self):
+        frame = np.random.default_rng(2).integers(0, 256, size=(48, 64, 3), dtype=np.uint8)
+        client, server = socket.socketpair()
+        with client, server:
+            send_message(client, {"op": "embed", "shape": list(frame.shape)}, memoryview(frame).cast("B"))
+            header, payload = recv_message(server)
+
+        self.assertEqual(header, {"op": "embed", "shape": [48, 64, 3]})
+        np.testing.assert_array_equal(np.frombuffer(payload, np.uint8).reshape(header["shape"]), frame)
+
+
+class RecognitionBenchmarkTests(SimpleTestCase):
+    def test_synthetic_gallery_is_benchmarked_per_backend(self):
+        run_backend = mock.Mock(return_value={"load_seconds": 0.1})
+        with mock.patch.object(benchmark_recognition, "_run_backend", run_backend), \
+                mock.patch.object(benchmark_recognition, "ProcessPoolExecutor",
+                                  lambda max_workers, mp_context: ThreadPoolExecutor(max_workers)):
+            out = StringIO()
+            call_command("benchmark_recognition", synthetic_people=3, synthetic_images=3,
+                         backends="deepface,onnx", stdout=out, stderr=StringIO())
+
+        report = json.loads(out.getvalue())
+        self.assertEqual((report["gallery"], report["people"], report["images"]), ("synthetic", 3, 9))
+        self.assertEqual(report["backends"], {"deepface": {"load_seconds": 0.1}, "onnx": {"load_seconds": 0.1}})
+        backend, gallery, cascade, threshold = run_backend.call_args.args
+        self.assertEqual((backend, len(gallery), cascade, threshold), ("onnx", 3, ["skip"], 0.45))
+
+    def test_gallery_too_small_is_an_error(self):
+        gallery = tempfile.mkdtemp(prefix="attendease-benchmark-")
+        self.addCleanup(shutil.rmtree, gallery, ignore_errors=True)
+        with self.assertRaises(CommandError):
+            call_command("benchmark_recognition", gallery=gallery, stdout=StringIO(), stderr=StringIO())
+
+    def test_error_rates(self):
+        rates = benchmark_recognition._error_rates([0.1, 0.5], [0.3, 0.9, 0.8, 0.7], threshold=0.4)
+        self.assertEqual((rates["far"], rates["frr"]), (0.25, 0.5))
+        self.assertEqual((rates["genuine_pairs"], rates["impostor_pairs"]), (2, 4))
+
+
+class FrameQualityTests(SimpleTestCase):
+    def textured(self, height, width, level=128):
+        rng = np.random.default_rng(5)
+        noise = rng.integers(-60, 61, size=(height, width, 3))
+        return np.clip(level + noise, 0, 255).astype(np.uint8)
+
+    def test_usable_frame_passes_and_large_frames_are_downscaled(self):
+        frame, hint = check_frame_quality(self.textured(720, 1280))
+        self.assertIsNone(hint)
+        self.assertEqual(min(frame.shape[:2]), settings.FACE_MAX_FRAME_SIDE)
+        self.assertAlmostEqual(frame.shape[1] / frame.shape[0], 1280 / 720, places=2)
+
+        small = self.textured(200, 240)
+        frame, hint = check_frame_quality(small)
+        self.assertIsNone(hint)
+        self.assertIs(frame, small)
+
+    def test_each_problem_gets_its_hint(self):
+        cases = {
+            "too small": self.textured(40, 60),
+            "too dark": np.full((240, 320, 3), 5, np.uint8),
+            "too bright": np.full((240, 320, 3), 250, np.uint8),
+            "blurry": np.full((240, 320, 3), 128, np.uint8),
+        }
+        for problem, frame in cases.items():
+            _, hint = check_frame_quality(frame)
+            self.assertIn(problem, hint.lower())
+        self.assertIsNotNone(check_frame_quality(None)[1])
+
+
+@override_settings(FACE_COOLDOWN_SECONDS=30)
+class CooldownTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_result_is_remembered_per_user_and_device(self):
+        self.assertIsNone(get_recent_result("alice"))
+        remember_result("alice", {"type": "check_in"})
+        remember_result("alice", {"type": "check_out"}, device="door-1")
+
+        self.assertEqual(get_recent_result("alice"), {"type": "check_in"})
+        self.assertEqual(get_recent_result("alice", device="door-1"), {"type": "check_out"})
+        self.assertIsNone(get_recent_result("alice", device="door-2"))
+        self.assertIsNone(get_recent_result("bob"))
+
+    @override_settings(FACE_COOLDOWN_SECONDS=0)
+    def test_zero_seconds_disables_the_cooldown(self):
+        remember_result("alice", {"type": "check_in"})
+        self.assertIsNone(get_recent_result("alice"))
+
+    async def test_repeat_scan_is_answered_without_recognition(self):
+        user = await CustomUser.objects.acreate_user(username="alice", password="x")
+        await self.async_client.aforce_login(user)
+        await aremember_result("alice", {"status": "success", "type": "check_in", "time": "09:00:00"})
+
+        with mock.patch("accounts.views.run_recognition_async") as recognition:
+            response = await self.async_client.post("/mark_attendance/", data=b"", content_type="application/octet-stream")
+        recognition.assert_not_called()
+        self.assertEqual(response.json(), {"status": "success", "type": "check_in", "time": "09:00:00", "cached": True})
+
+
+class FaceTemplateCatalogueTests(IsolatedMediaMixin, TestCase):
+    def add(self, source="test"):
+        return face_templates.add_numbered_template("stu", source, img=np.zeros((16, 16, 3), np.uint8))
+
+    def test_numbering_continues_after_deletions(self):
+        paths = [self.add() for _ in range(3)]
+        self.assertEqual([os.path.basename(path) for path in paths], ["stu_1.jpg", "stu_2.jpg", "stu_3.jpg"])
+
+        face_templates.delete_template(paths[1])
+        self.assertFalse(os.path.exists(paths[1]))
+        self.assertEqual(sorted(face_templates.template_files("stu")), ["stu_1.jpg", "stu_3.jpg"])
+
+        # Fixed-name images carry no number and don't disturb the sequence
+        new_face = self.write_image(os.path.join(self.media, "faces", "stu", "stu_new.jpg"))
+        self.assertIsNone(face_templates.record_template("stu", new_face, "enrollment").sequence)
+
+        self.assertEqual(os.path.basename(self.add()), "stu_4.jpg")
+        self.assertEqual(FaceTemplate.objects.get(image_path="faces/stu/stu_4.jpg").content_hash,
+                         file_sha256(os.path.join(self.media, "faces", "stu", "stu_4.jpg")))
+
+    def test_backfill_catalogues_new_files_and_drops_missing_ones(self):
+        self.add()
+        gone = self.add()
+        os.remove(gone)
+        copied = self.write_image(os.path.join(self.media, "faces", "stu", "stu_7.jpg"))
+
+        added, removed, touched = face_templates.backfill_templates()
+        self.assertEqual((added, removed, touched), (1, 1, {"stu"}))
+        self.assertEqual(sorted(face_templates.template_files("stu")), ["stu_1.jpg", "stu_7.jpg"])
+        self.assertEqual(FaceTemplate.objects.get(image_path="faces/stu/stu_7.jpg").sequence, 7)
+        self.assertEqual(os.path.basename(self.add()), "stu_8.jpg")
+
+
+class StoredEmbeddingTests(IsolatedMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = EmbeddingCache(os.path.join(self.media, "embedding_cache"))
+        self.enterContext(mock.patch.object(face_embeddings, "get_embedding_cache", return_value=self.cache))
+        self.enterContext(mock.patch.object(face_embeddings, "stored_face_crop", return_value=None))
+        self.represent = self.enterContext(mock.patch.object(
+            face_embeddings, "represent_crop", side_effect=lambda crop: np.random.default_rng().normal(size=128).astype(np.float32)
+        ))
+
+    def test_identical_bytes_are_embedded_once(self):
+        first = self.write_image(os.path.join(self.media, "faces", "stu", "stu_1.jpg"), seed=1)
+        copy = os.path.join(self.media, "faces", "stu", "stu_2.jpg")
+        shutil.copyfile(first, copy)
+
+        vector, content_hash = face_embeddings.embed_stored_image(first)
+        again, again_hash = face_embeddings.embed_stored_image(copy)
+        self.assertEqual(self.represent.call_count, 1)
+        self.assertEqual(content_hash, again_hash)
+        np.testing.assert_array_equal(vector, again)
+
+    def test_image_rewritten_in_place_is_re_embedded(self):
+        path = self.write_image(os.path.join(self.media, "faces", "stu", "stu_new.jpg"), seed=1)
+        face_templates.record_template("stu", path, "enrollment")
+        _, before = face_embeddings.sync_user_embeddings("stu")
+
+        # A later face change overwrites the file; the catalogue still has the old hash
+        self.write_image(path, seed=2)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        _, after = face_embeddings.sync_user_embeddings("stu")
+
+        self.assertEqual(self.represent.call_count, 2)
+        self.assertFalse(np.allclose(before, after))
+        self.assertEqual(FaceTemplate.objects.get(image_path="faces/stu/stu_new.jpg").content_hash, file_sha256(path))
+
+        # Untouched since: nothing is re-hashed or re-embedded
+        with mock.patch.object(face_embeddings, "file_sha256") as rehash:
+            face_embeddings.sync_user_embeddings("stu")
+        rehash.assert_not_called()
+        self.assertEqual(self.represent.call_count, 2)
+
+
+class GallerySnapshotTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix="attendease-snapshot-")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, "gallery.snap")
+        rng = np.random.default_rng(2)
+        self.vectors = rng.normal(size=(60, 128)).astype(np.float32)
+        self.labels = [f"user{i % 20:02d}" for i in range(60)]
+
+    def assert_same_index(self, loaded, index):
+        np.testing.assert_array_equal(loaded.matrix, index.matrix)
+        np.testing.assert_array_equal(loaded.ids, index.ids)
+        self.assertEqual(loaded.names, index.names)
+        for probe in self.vectors[:5]:
+            self.assertEqual(loaded.search(probe, k=3), index.search(probe, k=3))
+
+    def test_publish_and_load_round_trip(self):
+        self.assertIsNone(load_snapshot(self.path))
+        index = FaceIndex(self.vectors, self.labels)
+        self.assertEqual(publish_snapshot(index, generation=7, path=self.path), 1)
+
+        loaded = load_snapshot(self.path)
+        self.assertIsInstance(loaded.matrix, np.memmap)
+        self.assertEqual((loaded.version, loaded.generation), (1, 7))
+        self.assertIsNone(loaded.centroids)
+        self.assert_same_index(loaded, index)
+
+    def test_ivf_partitions_survive_and_versions_increase(self):
+        publish_snapshot(FaceIndex(self.vectors[:3], self.labels[:3]), generation=1, path=self.path)
+        index = FaceIndex(self.vectors, self.labels, nlist=4, nprobe=2)
+        self.assertEqual(publish_snapshot(index, generation=9, path=self.path), 2)
+
+        loaded = load_snapshot(self.path)
+        np.testing.assert_array_equal(loaded.centroids, index.centroids)
+        np.testing.assert_array_equal(loaded.offsets, index.offsets)
+        self.assertEqual(loaded.nprobe, 2)
+        self.assert_same_index(loaded, index)
+        self.assertEqual(read_snapshot_header(self.path)["rows"], 60)
+
+    def test_empty_gallery(self):
+        publish_snapshot(FaceIndex(np.empty((0, 0), np.float32), []), generation=0, path=self.path)
+        loaded = load_snapshot(self.path)
+        self.assertEqual(len(loaded), 0)
+        self.assertEqual(loaded.search(self.vectors[0]), [])
+
+
+class GalleryEventTests(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(4)
+        self.faces = {name: rng.normal(size=(2, 128)).astype(np.float32) for name in ("ann", "ben", "cal")}
+        base = FaceIndex(np.vstack(list(self.faces.values())), [name for name in self.faces for _ in range(2)])
+        base.generation = face_index.notify_gallery_change("cal", "enrollment")
+        self.live = face_index.LiveFaceIndex(base)
+        self.stores = {}
+        self.enterContext(mock.patch.object(face_index, "get_user_embeddings", self.stored))
+
+    def stored(self, username):
+        vectors = self.stores.get(username, np.empty((0, 0), np.float32))
+        return [f"{username}_{i}.jpg" for i in range(len(vectors))], vectors
+
+    def test_events_since_a_generation(self):
+        face_index.notify_gallery_change("ann", "face_update")
+        second = face_index.notify_gallery_change("ben", "removal")
+        third = face_index.notify_gallery_change("ann", "admin_approval")
+
+        self.assertEqual(face_index._events_since(self.live.generation), ({"ann", "ben"}, third))
+        self.assertEqual(face_index._events_since(second), ({"ann"}, third))
+        self.assertEqual(face_index._events_since(third), (set(), third))
+        self.assertEqual(face_index._latest_generation(), third)
+
+    def test_overlay_replaces_and_removes_users(self):
+        new_ann = np.random.default_rng(9).normal(size=(1, 128)).astype(np.float32)
+        self.stores["ann"] = new_ann
+        face_index.notify_gallery_change("ann", "face_update")
+        face_index.notify_gallery_change("ben", "removal")
+
+        usernames, latest = face_index._events_since(self.live.generation)
+        self.live.apply(usernames, latest)
+        self.assertEqual(self.live.generation, latest)
+        self.assertEqual(sorted(self.live.overlay), ["ann", "ben"])
+
+        # ann's old templates are masked by the overlay; ben is gone
+        self.assertEqual(self.live.search(new_ann[0], k=1)[0], ("ann", mock.ANY))
+        self.assertAlmostEqual(self.live.search(new_ann[0], k=1)[0][1], 0.0, places=5)
+        self.assertGreater(self.live.search(self.faces["ann"][0], k=3)[0][1], 0.5)
+        self.assertNotIn("ben", [name for name, _ in self.live.search(self.faces["ben"][0], k=3)])
+        self.assertEqual(self.live.search(self.faces["cal"][0], k=1)[0][0], "cal")
+
+    def test_publishing_drops_folded_events(self):
+        face_index.notify_gallery_change("ann", "face_update")
+        with mock.patch.object(face_index.FaceIndex, "from_store", return_value=self.live.base), \
+                mock.patch.object(face_index, "publish_snapshot", return_value=2):
+            face_index._build_and_publish()
+        self.assertFalse(GalleryEvent.objects.exists())
+
+
+class AbsenceWatermarkTests(TestCase):
+    def setUp(self):
+        self.today = date.today()
+        self.user = CustomUser.objects.create_user(username="absent", password="x")
+        self.user.date_joined = timezone.now() - timedelta(days=30)
+        self.user.save()
+        Attendance.objects.create(user=self.user, date=self.today - timedelta(days=3), status="Present")
+
+    def days(self):
+        return Attendance.objects.filter(user=self.user)
+
+    def test_first_visit_fills_from_date_joined(self):
+        joined = self.user.date_joined.date()
+        auto_mark_absent(self.user)
+
+        self.assertEqual(self.days().count(), (self.today - joined).days + 1)
+        self.assertEqual(self.days().exclude(status="Absent").count(), 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.absences_filled_through, self.today)
+
+        # A lost watermark refills the whole range without duplicating a day
+        count = self.days().count()
+        self.user.absences_filled_through = None
+        auto_mark_absent(self.user)
+        self.assertEqual(self.days().count(), count)
+
+    def test_later_visits_only_fill_the_gap(self):
+        auto_mark_absent(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            auto_mark_absent(self.user)
+        self.assertEqual(len(queries), 0)
+
+        # Last visit five days ago: only the days since are new
+        self.user.absences_filled_through = self.today - timedelta(days=5)
+        self.days().filter(date__gt=self.user.absences_filled_through, status="Absent").delete()
+        before = self.days().count()
+        auto_mark_absent(self.user)
+
+        self.assertEqual(self.days().count(), before + 4)
+        self.assertEqual(self.days().values("date").distinct().count(), self.days().count())
+        self.assertEqual(self.days().get(date=self.today - timedelta(days=3)).status, "Present")
+
+
+class KioskClipTests(SimpleTestCase):
+    """
+    A 300-frame (10 s at 30 fps) clip in which two people pass the door one
+    after the other, each in view for two seconds.
+    """
+
+    BOXES = {100: (60, 60, 80, 80), 200: (180, 60, 80, 80)}
+
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix="attendease-kiosk-")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.clip = os.path.join(directory, "door.avi")
+        writer = cv2.VideoWriter(self.clip, cv2.VideoWriter_fourcc(*"MJPG"), 30, (320, 240))
+        for i in range(300):
+            # The frame's brightness says who is in view: nobody, the first person or the second
+            level = 100 if 60 <= i < 120 else 200 if 180 <= i < 240 else 0
+            writer.write(np.full((240, 320, 3), level, np.uint8))
+        writer.release()
+
+    def fake_boxes(self, frame):
+        level = float(frame.mean())
+        return [] if level < 50 else [self.BOXES[100 if level < 150 else 200]]
+
+    def test_each_passer_is_recognized_once(self):
+        identities = iter(["first", "second"])
+        stream = KioskStream(self.clip, "door", idle_fps=1.0, active_fps=5.0)
+        with mock.patch("accounts.kiosk.detect_face_boxes", self.fake_boxes), \
+                mock.patch("accounts.kiosk.represent_live_face", return_value=(np.ones(128, np.float32), None)), \
+                mock.patch("accounts.kiosk.identify_embedding", side_effect=lambda vector, threshold: (next(identities), 0.2)), \
+                mock.patch.object(stream, "on_identified") as identified:
+            stats = stream.run()
+
+        self.assertEqual(stats["frames_read"], 300)
+        self.assertEqual(stats["recognitions"], 2)
+        self.assertEqual([call.args[0] for call in identified.call_args_list], ["first", "second"])
+        # Idle at 1 fps, 5 fps only while someone is tracked: a small fraction of the frames
+        self.assertLess(stats["frames_sampled"], 60)
+
+
+@override_settings(ATTENDANCE_PROJECTION_MS=0)
+class RosterAttendanceTests(TestCase):
+    def setUp(self):
+        self.students = [CustomUser.objects.create_user(username=f"class{i}", password="x") for i in range(3)]
+
+    def test_checks_in_new_students_and_reports_present_ones(self):
+        # An unprojected web scan already counts as present
+        mark_user_attendance(self.students[0])
+        checked_in, already_present = mark_roster_attendance(self.students)
+        self.assertEqual(checked_in, ["class1", "class2"])
+        self.assertEqual(already_present, ["class0"])
+
+        self.assertEqual(
+            sorted(Attendance.objects.filter(status="Checked In").values_list("user__username", flat=True)),
+            ["class0", "class1", "class2"],
+        )
+        self.assertEqual(mark_roster_attendance(self.students), ([], ["class0", "class1", "class2"]))
+        self.assertEqual(AttendanceEvent.objects.filter(device="classroom").count(), 2)
+
+
+class ClassroomRecognitionTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(8)
+        self.templates = {name: rng.normal(size=(1, 128)).astype(np.float32) for name in ("ana", "bo", "cy", "outsider")}
+        self.enterContext(mock.patch.object(
+            face_scan_bulk, "get_user_embeddings", lambda username: (["x.jpg"], self.templates[username])
+        ))
+
+    def classify(self, faces, usernames):
+        vectors = np.vstack(faces)
+        areas = [{"x": 10 * i, "y": 0, "w": 8, "h": 8} for i in range(len(faces))]
+        with mock.patch.object(face_scan_bulk, "represent_all_faces", return_value=(vectors, areas)):
+            return face_scan_bulk.recognize_classroom(None, usernames)
+
+    def test_each_face_and_student_is_matched_at_most_once(self):
+        ana, bo = self.templates["ana"][0], self.templates["bo"][0]
+        noise = np.random.default_rng(1).normal(scale=0.02, size=128)
+        # Two faces both closest to ana: the nearer one wins, the other stays unmatched
+        result = self.classify([ana + noise, ana + 5 * noise, bo], ["ana", "bo", "cy"])
+
+        self.assertEqual(result["faces"], 3)
+        self.assertEqual(sorted(result["matches"]), ["ana", "bo"])
+        self.assertEqual(result["matches"]["ana"]["area"]["x"], 0)
+        self.assertEqual(result["matches"]["bo"]["area"]["x"], 20)
+        self.assertEqual(result["unmatched"], [{"x": 10, "y": 0, "w": 8, "h": 8}])
+
+    def test_only_the_roster_can_match(self):
+        result = self.classify([self.templates["outsider"][0]], ["ana", "bo"])
+        self.assertEqual(result["matches"], {})
+        self.assertEqual(len(result["unmatched"]), 1)
+
+
+class ClassroomViewTests(TestCase):
+    def setUp(self):
+        self.faculty = CustomUser.objects.create_user(username="prof", password="x", user_type="faculty")
+        self.students = [CustomUser.objects.create_user(username=name, password="x") for name in ("ana", "bo")]
+        self.roster = ClassRoster.objects.create(name="Physics", faculty=self.faculty)
+        self.roster.students.add(*self.students)
+        self.client.force_login(self.faculty)
+        _, jpeg = cv2.imencode(".jpg", np.zeros((64, 64, 3), np.uint8))
+        self.photo = jpeg.tobytes()
+
+    def post(self, roster_id, recognition):
+        async def run_inline(fn, *args, **kwargs):
+            return recognition(*args, **kwargs)
+
+        data = {"photo": SimpleUploadedFile("class.jpg", self.photo, content_type="image/jpeg")}
+        if roster_id is not None:
+            data["roster_id"] = roster_id
+        with mock.patch("accounts.views.run_recognition_async", run_inline):
+            return self.client.post("/classroom_attendance/", data)
+
+    def test_matched_students_are_checked_in(self):
+        result = {"faces": 2, "matches": {"ana": {"distance": 0.1, "area": {}}}, "unmatched": [{}]}
+        response = self.post(self.roster.id, lambda photo, usernames: result)
+
+        body = response.json()
+        self.assertEqual((body["status"], body["checked_in"], body["not_seen"]), ("success", ["ana"], ["bo"]))
+        self.assertEqual(self.post(self.roster.id, lambda photo, usernames: result).json()["already_present"], ["ana"])
+
+    def test_bad_roster_id_is_a_400(self):
+        for roster_id in (None, "", "physics"):
+            self.assertEqual(self.post(roster_id, None).status_code, 400)
+
+    def test_recognition_errors_are_not_leaked(self):
+        def fail(photo, usernames):
+            raise RuntimeError("secret internals")
+
+        with mock.patch("traceback.print_exc"):
+            body = self.post(self.roster.id, fail).json()
+        self.assertEqual(body["status"], "error")
+        self.assertNotIn("secret", body["message"])
+
+
+@override_settings(FACE_EXECUTOR="thread", FACE_EXECUTOR_WORKERS=1, FACE_EXECUTOR_QUEUE=0,
+                   FACE_RECOGNITION_DEADLINE=0.2, FACE_COOLDOWN_SECONDS=0)
+class RecognitionBackpressureTests(TestCase):
+    def setUp(self):
+        # A private executor per test
+        stats = dict.fromkeys(recognition_pool._stats, 0)
+        for name, value in (("_executor", None), ("_slots", None), ("_warmups", []), ("_stats", stats)):
+            self.enterContext(mock.patch.object(recognition_pool, name, value))
+        self.enterContext(mock.patch("accounts.views.check_frame_quality", lambda frame: (frame, None)))
+        user = CustomUser.objects.create_user(username="busy", password="x")
+        self.client.force_login(user)
+        _, jpeg = cv2.imencode(".jpg", np.zeros((64, 64, 3), np.uint8))
+        self.frame = jpeg.tobytes()
+
+    def scan(self):
+        return self.client.post("/mark_attendance/", data=self.frame, content_type="application/octet-stream")
+
+    def test_full_queue_is_a_503_with_retry_after(self):
+        release = threading.Event()
+        blocker = recognition_pool._submit(release.wait, (), {})
+        try:
+            response = self.scan()
+        finally:
+            release.set()
+            blocker.result()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], str(settings.FACE_RETRY_AFTER_SECONDS))
+
+    def test_missed_deadline_is_a_504(self):
+        def slow_match(frame, username):
+            time.sleep(0.5)
+            return {"username": username, "distance": 0.1, "detector": "test"}
+
+        with mock.patch("accounts.views.match_logged_in_user", slow_match):
+            response = self.scan()
+        self.assertEqual(response.status_code, 504)
+        # The abandoned job still finishes and gives its slot back
+        while recognition_stats()["in_flight"]:
+            time.sleep(0.05)
+        self.assertEqual(recognition_stats()["timed_out"], 1)
+
+    @override_settings(FACE_EXECUTOR="process", FACE_SERVICE_SOCKET="")
+    def test_health_probe_starts_a_cold_pool(self):
+        def thread_pool(max_workers, **kwargs):
+            return ThreadPoolExecutor(max_workers=max_workers)
+
+        with mock.patch.object(recognition_pool, "ProcessPoolExecutor", thread_pool), \
+                mock.patch.object(recognition_pool, "_warm_status", return_value={"status": "ready", "error": None}):
+            self.assertEqual(worker_model_status()["status"], "loading")
+            recognition_pool._warmups[0].result()
+            self.assertEqual(worker_model_status()["status"], "ready")
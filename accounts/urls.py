@@ -25,6 +25,8 @@ urlpatterns = [
     
     path('face_scan/', views.face_scan, name='face_scan'),
     path('mark_attendance/', views.mark_attendance_ajax, name='mark_attendance'),
+    path('health/face/', views.face_health, name='face_health'),
+    path('classroom_attendance/', views.classroom_attendance, name='classroom_attendance'),
     
     path('face_view/', views.face_view , name='face_view'),
     path('leaverequest/', views.leave_request_view , name='leave_request'), 
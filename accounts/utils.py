@@ -1,23 +1,69 @@
 import os
-from datetime import datetime
+from datetime import datetime, time
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from .models import Attendance
+from django.db import transaction
+from django.utils import timezone
+from .attendance_log import project_pending, record_event, scan_outcome
+from .models import Attendance, AttendanceEvent, CustomUser
 
-def mark_user_attendance(user):
-    today = datetime.today().date()
-    now_time = datetime.now()
+def mark_user_attendance(user, device="web", distance=None):
+    """
+    Records a scan as one AttendanceEvent INSERT and reads back what it
+    meant: check-in on the first scan of the day, check-out on the second,
+    nothing after that. The user's row is locked for the transaction, so
+    concurrent scans for one user are decided one after another and each
+    sees the events committed before it (on Postgres, ids are allocated
+    before commit, not in commit order). Attendance is updated by the
+    projector (attendance_log.project_pending).
+    Returns (action, time string or None, check_in time).
+    """
+    with transaction.atomic():
+        CustomUser.objects.select_for_update().only("pk").get(pk=user.pk)
+        event = record_event(user, kind="scan", device=device, distance=distance)
+        return scan_outcome(event)
 
-    # Get or create attendance record for today
-    attendance, created = Attendance.objects.get_or_create(user=user, date=today)
 
-    if not attendance.check_in:
-        attendance.check_in = now_time
-        attendance.save()
-        return "check_in", now_time.strftime("%H:%M:%S"), attendance.check_in
-    elif not attendance.check_out:
-        attendance.check_out = now_time
-        attendance.save()
-        return "check_out", now_time.strftime("%H:%M:%S"), attendance.check_in
-    else:
-        # Already checked in and out
-        return "completed", None, attendance.check_in
\ No newline at end of file
+async def amark_user_attendance(user, device="web", distance=None):
+    """
+    mark_user_attendance for async views; the locking transaction runs in a
+    worker thread (transactions are not available through the async ORM).
+    """
+    return await sync_to_async(mark_user_attendance)(user, device=device, distance=distance)
+
+
+def mark_roster_attendance(users):
+    """
+    Checks in every recognized student from a classroom photo with one
+    bulk INSERT of check-in events, then projects them.
+    Students who already checked in today are left as they are. The
+    students' rows are locked like in mark_user_attendance, so a scan
+    landing meanwhile is either seen here or decided after this insert.
+    Returns (checked_in_usernames, already_present_usernames).
+    """
+    today = timezone.localdate()
+    day_start = timezone.make_aware(datetime.combine(today, time.min))
+    user_ids = [user.id for user in users]
+    with transaction.atomic():
+        # Locked in id order so two overlapping rosters can't deadlock
+        list(CustomUser.objects.select_for_update().filter(pk__in=user_ids).order_by("pk").values_list("pk", flat=True))
+        # The event log decides (like scan_outcome), plus rows entered by hand
+        present = set(
+            AttendanceEvent.objects.filter(user_id__in=user_ids, timestamp__gte=day_start).values_list("user_id", flat=True)
+        ) | set(
+            Attendance.objects.filter(user_id__in=user_ids, date=today, check_in__isnull=False).values_list("user_id", flat=True)
+        )
+        now = timezone.now()
+        AttendanceEvent.objects.bulk_create(
+            [
+                AttendanceEvent(user=user, kind="check_in", device="classroom", timestamp=now)
+                for user in users if user.id not in present
+            ],
+            ignore_conflicts=True,
+        )
+    project_pending()
+
+    return (
+        [user.username for user in users if user.id not in present],
+        [user.username for user in users if user.id in present],
+    )
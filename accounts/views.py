@@ -5,7 +5,7 @@ from django.http import HttpResponse
 from django.contrib.auth.views import LoginView
 from django.template import loader
 
-from .models import Attendance, CustomUser, FaceChangeRequest, LeaveRequest, MasterUserRecord , UserFace
+from .models import Attendance, ClassRoster, CustomUser, FaceChangeRequest, LeaveRequest, MasterUserRecord , UserFace
 from .forms import RegistrationForm
 
 from django.contrib.auth import authenticate, login
@@ -18,6 +18,7 @@ from django.core.exceptions import ValidationError
 from django.contrib import messages
 
 from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
 import requests
 import json
 import traceback
@@ -43,12 +44,19 @@ from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect
 from django.utils.timezone import now
 
-from .utils import mark_user_attendance
+from .utils import mark_roster_attendance
 
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from .face_system import add_face_image, decode_base64_image, recognize_logged_in_user
-from deepface import DeepFace
+from .face_system import check_frame_quality, decode_request_image, match_logged_in_user
+from .face_scan_bulk import recognize_classroom
+from .attendance_buffer import arecord_scan, buffer_status
+from .attendance_log import project_pending
+from .cooldown import aget_recent_result, aremember_result, cooldown_stats
+from .face_index import index_status, notify_gallery_change
+from .face_embeddings import MATCH_THRESHOLD, add_user_embedding, cosine_distances, embed_stored_image, remove_user_embedding
+from .face_templates import record_template, remove_template
+from .recognition_pool import RecognitionBusy, RecognitionTimeout, recognition_stats, run_recognition_async, worker_model_status
 
 @login_required
 @csrf_exempt
@@ -96,6 +104,7 @@ def face_view(request):
 def face_scan(request):
     user = request.user
     today = datetime.today().date()
+    project_pending()
 
     try:
         attendance = Attendance.objects.get(user=user, date=today)
@@ -124,79 +133,155 @@ def face_scan(request):
     
 @csrf_exempt
 @login_required
-def mark_attendance_ajax(request):
+async def mark_attendance_ajax(request):
+    # Async: while the scan waits on the recognition executor it holds no
+    # thread, so one ASGI worker can keep many scans in flight
     if request.method != "POST":
         return JsonResponse({"status": "error", "message": "Invalid request"})
+    user = await request.auser()
 
-    data = json.loads(request.body)
-    image_data = data.get("image_data")
-    if not image_data:
-        return JsonResponse({"status": "error", "message": "No image received"})
+    # Repeat scan inside the cooldown window: answer from the last result
+    recent = await aget_recent_result(user.username)
+    if recent:
+        return JsonResponse({**recent, "cached": True})
 
-    frame = decode_base64_image(image_data)
+    # Raw JPEG (octet-stream / multipart) or the legacy base64 JSON body
+    frame = decode_request_image(request)
+    if frame is None:
+        return JsonResponse({"status": "error", "message": "No image received"})
 
-    # Recognize face → returns username string
-    username = recognize_logged_in_user(frame, request.user.username)
-    if not username:
-        return JsonResponse({"status": "error", "message": "No face detected or unclear."})
+    # Reject blurred / dark / tiny frames before paying for any model inference
+    frame, hint = check_frame_quality(frame)
+    if hint:
+        return JsonResponse({"status": "error", "message": hint})
 
-    from django.contrib.auth import get_user_model
-    User = get_user_model()
+    # Recognize face → returns username plus the detector stage that found it.
+    # Runs on the bounded executor so a scan burst can't pin every web worker.
     try:
-        user_obj = User.objects.get(username=username)
-    except User.DoesNotExist:
-        return JsonResponse({"status": "error", "message": "User not found"})
-
-    from .utils import mark_user_attendance
-    status, time, check_in_time = mark_user_attendance(user_obj)
-
-    # Safely create/update today's attendance
-    attendance, created = Attendance.objects.get_or_create(
-        user=user_obj,
-        date=date.today(),
-        defaults={
-            "status": status,
-            "check_in": check_in_time,
-        }
-    )
+        match = await run_recognition_async(match_logged_in_user, frame, user.username)
+    except RecognitionBusy:
+        response = JsonResponse(
+            {"status": "error", "message": "Scanner is busy. Please try again in a moment."},
+            status=503,
+        )
+        response["Retry-After"] = str(settings.FACE_RETRY_AFTER_SECONDS)
+        return response
+    except RecognitionTimeout:
+        return JsonResponse({"status": "error", "message": "Face verification timed out. Please try again."}, status=504)
+    username = match["username"]
+    if not username:
+        return JsonResponse({"status": "error", "message": "No face detected or unclear.", "detector": match["detector"]})
 
-    # If record exists but only check_in is missing (user already has Absent)
-    if not created and not attendance.check_in:
-        attendance.check_in = check_in_time
-        attendance.status = status
-        attendance.save()
+    # The match is always the logged-in user: write through the single atomic path
+    # (or the write-behind buffer during rush hour, see ATTENDANCE_WRITE_BEHIND)
+    status, time, check_in_time = await arecord_scan(user, distance=match["distance"])
 
-    return JsonResponse({
+    result = {
         "status": "success",
         "username": username,
         "type": status,
         "time": time,
-        "check_in": check_in_time.strftime("%H:%M:%S") if check_in_time else None
+        "check_in": check_in_time.strftime("%H:%M:%S") if check_in_time else None,
+        "detector": match["detector"],
+    }
+    await aremember_result(user.username, result)
+    return JsonResponse(result)
+
+def face_health(request):
+    """Load balancer probe: 200 only once this worker's face models are warm."""
+    state = worker_model_status()
+    state["queue"] = recognition_stats()
+    state["cooldown"] = cooldown_stats()
+    state["index"] = index_status()
+    state["attendance_buffer"] = buffer_status()
+    return JsonResponse(state, status=200 if state["status"] == "ready" else 503)
+
+@login_required
+async def classroom_attendance(request):
+    """
+    Faculty upload one classroom photo; every face in it is matched against
+    the chosen roster and attendance is written for all matches at once.
+    Async like mark_attendance_ajax, so the recognition wait holds no thread.
+    """
+    user = await request.auser()
+    if user.user_type != "faculty" and not user.is_superuser:
+        return redirect("userdash")
+
+    rosters = ClassRoster.objects.all() if user.is_superuser else ClassRoster.objects.filter(faculty=user)
+    if request.method != "POST":
+        return await sync_to_async(render)(request, "classroom_scan.html", {"rosters": rosters.order_by("name")})
+
+    try:
+        roster_id = int(request.POST.get("roster_id", ""))
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "Choose a class and a photo."}, status=400)
+
+    roster = await rosters.filter(id=roster_id).afirst()
+    photo_file = request.FILES.get("photo")
+    if not roster or not photo_file:
+        return JsonResponse({"status": "error", "message": "Choose a class and a photo."})
+
+    photo = cv2.imdecode(np.frombuffer(photo_file.read(), np.uint8), cv2.IMREAD_COLOR)
+    if photo is None:
+        return JsonResponse({"status": "error", "message": "Could not read the photo."})
+
+    # Keep faces at the back of the room; only shrink very large camera images
+    scale = settings.FACE_CLASSROOM_MAX_SIDE / max(photo.shape[:2])
+    if scale < 1:
+        photo = cv2.resize(photo, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    students = [student async for student in roster.students.all()]
+    try:
+        result = await run_recognition_async(recognize_classroom, photo, [student.username for student in students])
+    except RecognitionBusy:
+        response = JsonResponse({"status": "error", "message": "Scanner is busy. Please try again in a moment."}, status=503)
+        response["Retry-After"] = str(settings.FACE_RETRY_AFTER_SECONDS)
+        return response
+    except RecognitionTimeout:
+        return JsonResponse({"status": "error", "message": "Recognition timed out. Please try again."}, status=504)
+    except Exception:
+        traceback.print_exc()
+        return JsonResponse({"status": "error", "message": "Recognition failed. Please try again."})
+
+    matched = [student for student in students if student.username in result["matches"]]
+    checked_in, already_present = await sync_to_async(mark_roster_attendance)(matched) if matched else ([], [])
+
+    return JsonResponse({
+        "status": "success",
+        "roster": roster.name,
+        "faces": result["faces"],
+        "checked_in": checked_in,
+        "already_present": already_present,
+        "not_seen": [student.username for student in students if student.username not in result["matches"]],
+        "unmatched_faces": len(result["unmatched"]),
+        "matches": result["matches"],
     })
 
 def auto_mark_absent(user):
-    """Automatically create missing 'Absent' records safely."""
+    """
+    Creates the missing 'Absent' records since the user's watermark
+    (absences_filled_through) with one bulk insert, then advances it.
+    Days that already have a record are skipped by the unique (user, date).
+    """
     today = date.today()
-    first_date = user.date_joined.date()
+    filled = user.absences_filled_through
+    if filled is not None and filled >= today:
+        return
 
-    # Fetch existing dates once
-    existing_dates = set(
-        Attendance.objects.filter(user=user).values_list('date', flat=True)
-    )
-
-    current = first_date
+    current = filled + timedelta(days=1) if filled else user.date_joined.date()
+    missing = []
     while current <= today:
-        if current not in existing_dates:
-            Attendance.objects.get_or_create(
-                user=user,
-                date=current,
-                defaults={"status": "Absent"}
-            )
+        missing.append(Attendance(user=user, date=current, status="Absent"))
         current += timedelta(days=1)
+    Attendance.objects.bulk_create(missing, ignore_conflicts=True)
+
+    CustomUser.objects.filter(pk=user.pk).update(absences_filled_through=today)
+    user.absences_filled_through = today
         
 @login_required
 def attendance_report(request):
-    # Auto-mark absent safely
+    # Fold in scans not yet projected, then auto-mark absent safely
+    project_pending()
     auto_mark_absent(request.user)
 
     # Fetch attendance
@@ -206,7 +291,8 @@ def attendance_report(request):
 
 @login_required
 def download_attendance_csv(request):
-    # Step 1: Auto-create missing "Absent" records first
+    # Step 1: Fold in pending scans, then auto-create missing "Absent" records
+    project_pending()
     auto_mark_absent(request.user)
 
     # Step 2: Fetch all attendance for the logged-in user
@@ -276,58 +362,93 @@ def download_attendance_csv(request):
 def help_support(request):
     return render(request, "help_support.html")
 
+def _store_face_update(username, path, img, source, embedded=True):
+    # Callers embed on the recognition executor first, so add_user_embedding
+    # hits the embedding cache instead of running the model in the web process
+    record_template(username, path, source)
+    if embedded:
+        add_user_embedding(username, path, img=img)
+    notify_gallery_change(username, source)
+
+
+def _discard_face_update(username, path):
+    if os.path.exists(path):
+        os.remove(path)
+    remove_template(path)
+    remove_user_embedding(username, os.path.basename(path))
+    notify_gallery_change(username, "removal")
+
+
 @login_required
 @csrf_exempt
-def face_add(request):
-    user = request.user
-    user_face = UserFace.objects.filter(user=user).first()
+async def face_add(request):
+    # Async like mark_attendance_ajax: embeddings run on the recognition
+    # executor, the gallery bookkeeping in a worker thread
+    user = await request.auser()
+    user_face = await UserFace.objects.filter(user=user).afirst()
     has_face = bool(user_face and user_face.face_image)
 
     if request.method == "POST":
-        import json
-        data = json.loads(request.body)
-        img_data = data.get("image_data")
+        img = decode_request_image(request)
 
-        if img_data:
+        if img is not None:
             # Save new image
             faces_dir = os.path.join(settings.MEDIA_ROOT, "faces", user.username)
             os.makedirs(faces_dir, exist_ok=True)
             new_face_path = os.path.join(faces_dir, f"{user.username}_new.jpg")
-
-            header, encoded = img_data.split(",", 1)
-            img_bytes = base64.b64decode(encoded)
-            nparr = np.frombuffer(img_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
             cv2.imwrite(new_face_path, img)
 
             # ✅ If no existing face (first time)
             if not has_face:
-                UserFace.objects.update_or_create(
+                embedded = True
+                try:
+                    await run_recognition_async(embed_stored_image, new_face_path, img=img)
+                except RecognitionBusy:
+                    response = JsonResponse(
+                        {"status": "error", "message": "Scanner is busy. Please try again in a moment."},
+                        status=503,
+                    )
+                    response["Retry-After"] = str(settings.FACE_RETRY_AFTER_SECONDS)
+                    return response
+                except RecognitionTimeout:
+                    return JsonResponse({"status": "error", "message": "Face registration timed out. Please try again."}, status=504)
+                except Exception as e:
+                    # Registered without an embedding, as before; the store is synced later
+                    print(f"[Embedding Error] {new_face_path}: {e}")
+                    embedded = False
+
+                await UserFace.objects.aupdate_or_create(
                     user=user,
                     defaults={"face_image": f"faces/{user.username}/{user.username}_new.jpg"}
                 )
                 user.has_face_data = True
-                user.save()
+                await user.asave()
+                await sync_to_async(_store_face_update)(user.username, new_face_path, img, "enrollment", embedded)
                 return JsonResponse({"status": "success", "message": "✅ Face registered successfully!"})
 
-            # ✅ Compare with default master face using DeepFace
+            # ✅ Compare with default master face using Facenet embeddings
             try:
+                # Both sides come from stored aligned crops / the embedding cache, so the
+                # new image is detected once and the master image not at all
                 master_face_path = os.path.join(settings.MEDIA_ROOT, user_face.face_image.name)
-                result = DeepFace.verify(img1_path=master_face_path, img2_path=new_face_path, model_name="Facenet")
+                new_vector, _ = await run_recognition_async(embed_stored_image, new_face_path, img=img)
+                master_vector, _ = await run_recognition_async(embed_stored_image, master_face_path)
+                distance = cosine_distances(new_vector, master_vector[None, :])[0]
 
-                if result["verified"]:
+                if distance <= MATCH_THRESHOLD:
                     # Match confirmed → auto-approve
-                    FaceChangeRequest.objects.create(
+                    await FaceChangeRequest.objects.acreate(
                         user=user,
                         new_face_path=new_face_path,
                         status="Approved"
                     )
 
                     # Replace old face with new one
-                    UserFace.objects.update_or_create(
+                    await UserFace.objects.aupdate_or_create(
                         user=user,
                         defaults={"face_image": f"faces/{user.username}/{user.username}_new.jpg"}
                     )
+                    await sync_to_async(_store_face_update)(user.username, new_face_path, img, "face_update")
 
                     return JsonResponse({
                         "status": "success",
@@ -335,15 +456,14 @@ def face_add(request):
                     })
                 else:
                     # Mismatch → auto-reject
-                    FaceChangeRequest.objects.create(
+                    await FaceChangeRequest.objects.acreate(
                         user=user,
                         new_face_path=new_face_path,
                         status="Rejected"
                     )
 
                     # ✅ Auto-delete the unmatched image
-                    if os.path.exists(new_face_path):
-                        os.remove(new_face_path)
+                    await sync_to_async(_discard_face_update)(user.username, new_face_path)
 
                     return JsonResponse({
                         "status": "error",
@@ -361,9 +481,10 @@ def face_add(request):
 
     # GET request — display current faces
     old_face_url = user_face.face_image.url if has_face else None
-    approved_request = FaceChangeRequest.objects.filter(user=user, status="Approved").last()
+    approved_request = await FaceChangeRequest.objects.filter(user=user, status="Approved").alast()
 
-    return render(request, "face_add.html", {
+    # Template context processors touch the session user synchronously
+    return await sync_to_async(render)(request, "face_add.html", {
         "user": user,
         "old_face": old_face_url,
         "approved_request": approved_request,
@@ -759,6 +880,8 @@ def login_view(request):
 
 @login_required
 def userdash_view(request):
+    # The calendar reads Attendance: fold in scans not yet projected
+    project_pending()
     month = int(request.GET.get('month', datetime.today().month))
     year = int(request.GET.get('year', datetime.today().year))
 
@@ -50,7 +50,9 @@ WSGI_APPLICATION = "attendease.wsgi.application"
 if "DATABASE_URL" in os.environ:
     DATABASES = {
         "default": dj_database_url.config(
-            conn_max_age=600,
+            # Served over ASGI (see Procfile): Django's persistent connections
+            # aren't safe across the event loop's threads, so close per request
+            conn_max_age=0,
             ssl_require=True,
         )
     }
@@ -59,6 +61,11 @@ else:
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
+            # Writers take the lock at BEGIN and wait for it, so concurrent
+            # attendance scans queue up instead of failing with "database is locked"
+            "OPTIONS": {"transaction_mode": "IMMEDIATE", "timeout": 20},
+            # A file (not shared-cache memory) so tests can exercise concurrent writers
+            "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
         }
     }
 
@@ -110,6 +117,9 @@ JAZZMIN_SETTINGS = {
         "accounts.LeaveRequest": "fas fa-plane-departure",
         "accounts.userface": "fas fa-id-card",
         "accounts.CustomUser": "fas fa-users",
+        "accounts.ClassRoster": "fas fa-chalkboard-teacher",
+        "accounts.FaceTemplate": "fas fa-images",
+        "accounts.AttendanceEvent": "fas fa-stream",
         "auth.Group": "fas fa-users-cog",
     },
 }
@@ -130,6 +140,107 @@ DEEPFACE_HOME = os.getenv(
 os.makedirs(DEEPFACE_HOME, exist_ok=True)
 os.environ["DEEPFACE_HOME"] = DEEPFACE_HOME
 
+# Build + warm the face models when a worker starts (set by the Procfile)
+FACE_MODEL_WARMUP = os.getenv("FACE_MODEL_WARMUP", "False").lower() == "true"
+
+# Facenet inference backend: "deepface" (TensorFlow) or "onnx" (ONNX Runtime,
+# using a model exported with manage.py export_facenet_onnx). Detection still
+# uses DeepFace's detectors either way. 0 threads = ONNX Runtime's default.
+FACE_INFERENCE_BACKEND = os.getenv("FACE_INFERENCE_BACKEND", "deepface")
+FACE_ONNX_MODEL_PATH = os.getenv(
+    "FACE_ONNX_MODEL_PATH", str(BASE_DIR / "media" / "deepface_models" / "facenet.onnx")
+)
+FACE_ONNX_THREADS = int(os.getenv("FACE_ONNX_THREADS", "0"))
+
+# Frame quality gate run before any model inference (face_system.check_frame_quality).
+# Frames whose short side exceeds MAX_FRAME_SIDE are downscaled to it.
+FACE_MIN_FRAME_SIDE = int(os.getenv("FACE_MIN_FRAME_SIDE", "80"))
+FACE_MAX_FRAME_SIDE = int(os.getenv("FACE_MAX_FRAME_SIDE", "320"))
+FACE_MIN_BRIGHTNESS = float(os.getenv("FACE_MIN_BRIGHTNESS", "40"))
+FACE_MAX_BRIGHTNESS = float(os.getenv("FACE_MAX_BRIGHTNESS", "220"))
+FACE_MIN_SHARPNESS = float(os.getenv("FACE_MIN_SHARPNESS", "40"))  # Laplacian variance
+
+# Live-scan detector cascade, cheapest first; later stages only run when the
+# earlier ones find no face. Add "skip" (e.g. "skip,opencv,mtcnn") to trust the
+# square centred crop from face_scan.html without running a detector at all.
+FACE_DETECTOR_CASCADE = [
+    stage.strip()
+    for stage in os.getenv("FACE_DETECTOR_CASCADE", "opencv,mtcnn").split(",")
+    if stage.strip()
+]
+FACE_SKIP_MIN_SIDE = int(os.getenv("FACE_SKIP_MIN_SIDE", "112"))
+FACE_SKIP_MAX_SIDE = int(os.getenv("FACE_SKIP_MAX_SIDE", "320"))
+FACE_SKIP_MAX_ASPECT = float(os.getenv("FACE_SKIP_MAX_ASPECT", "1.15"))
+
+# Shared recognition service (manage.py run_recognition_service). When the
+# socket is set, web workers send frames there instead of loading TensorFlow.
+# The service batches concurrent frames for up to MAX_WAIT_MS / MAX_BATCH.
+FACE_SERVICE_SOCKET = os.getenv("FACE_SERVICE_SOCKET", "")
+FACE_SERVICE_MAX_BATCH = int(os.getenv("FACE_SERVICE_MAX_BATCH", "16"))
+FACE_SERVICE_MAX_WAIT_MS = int(os.getenv("FACE_SERVICE_MAX_WAIT_MS", "20"))
+FACE_SERVICE_TIMEOUT = float(os.getenv("FACE_SERVICE_TIMEOUT", "10"))
+
+# Bounded recognition executor for mark_attendance. "process" runs scans in
+# spawned worker processes, "thread" in this process. Beyond WORKERS running +
+# QUEUE waiting jobs, scans are rejected at once with 503 + Retry-After.
+# Under ASGI (see Procfile) a waiting scan is a suspended coroutine rather
+# than a blocked thread, so QUEUE can be far deeper than the thread count.
+FACE_EXECUTOR = os.getenv("FACE_EXECUTOR", "process")
+FACE_EXECUTOR_WORKERS = int(os.getenv("FACE_EXECUTOR_WORKERS", "1"))
+FACE_EXECUTOR_QUEUE = int(os.getenv("FACE_EXECUTOR_QUEUE", "4"))
+FACE_RECOGNITION_DEADLINE = float(os.getenv("FACE_RECOGNITION_DEADLINE", "8"))
+FACE_RETRY_AFTER_SECONDS = int(os.getenv("FACE_RETRY_AFTER_SECONDS", "2"))
+
+# Classroom photos (classroom_attendance) are downscaled so their long side is
+# at most this; kept large so small faces at the back of the room survive
+FACE_CLASSROOM_MAX_SIDE = int(os.getenv("FACE_CLASSROOM_MAX_SIDE", "1920"))
+
+# Door-camera kiosk (manage.py run_kiosk): frames are sampled at IDLE_FPS with
+# nobody in view and ACTIVE_FPS while a face is tracked. A track is dropped
+# after TRACK_TTL seconds unseen and gets at most MAX_ATTEMPTS recognitions.
+FACE_KIOSK_IDLE_FPS = float(os.getenv("FACE_KIOSK_IDLE_FPS", "1"))
+FACE_KIOSK_ACTIVE_FPS = float(os.getenv("FACE_KIOSK_ACTIVE_FPS", "5"))
+FACE_KIOSK_TRACK_TTL = float(os.getenv("FACE_KIOSK_TRACK_TTL", "2"))
+FACE_KIOSK_MAX_ATTEMPTS = int(os.getenv("FACE_KIOSK_MAX_ATTEMPTS", "3"))
+
+# Each user keeps at most this many enrolled templates (0 = unlimited); extra
+# approvals prune the most redundant image, never the profile/master photo
+FACE_MAX_TEMPLATES_PER_USER = int(os.getenv("FACE_MAX_TEMPLATES_PER_USER", "5"))
+# Logged-in verification compares against the user's centroid and only checks
+# individual templates when the centroid distance is this close to the threshold
+FACE_CENTROID_MARGIN = float(os.getenv("FACE_CENTROID_MARGIN", "0.1"))
+
+# Write-behind attendance: scans are journaled (fsynced) under
+# MEDIA_ROOT/attendance_journal and acknowledged at once, then written to
+# Attendance in batches every ATTENDANCE_FLUSH_EVENTS scans or ATTENDANCE_FLUSH_MS
+ATTENDANCE_WRITE_BEHIND = os.getenv("ATTENDANCE_WRITE_BEHIND", "false").lower() == "true"
+ATTENDANCE_FLUSH_EVENTS = int(os.getenv("ATTENDANCE_FLUSH_EVENTS", "200"))
+ATTENDANCE_FLUSH_MS = int(os.getenv("ATTENDANCE_FLUSH_MS", "500"))
+# How often a process that records AttendanceEvents folds them into Attendance
+# (views that read Attendance also fold pending events first). 0 disables the
+# background projector.
+ATTENDANCE_PROJECTION_MS = int(os.getenv("ATTENDANCE_PROJECTION_MS", "1000"))
+
+# Re-recognition cooldown: within this many seconds of a successful scan the
+# same user (per kiosk device) gets the previous result back without a model
+# run or DB write. 0 disables it. Uses the default Django cache (CACHES).
+FACE_COOLDOWN_SECONDS = int(os.getenv("FACE_COOLDOWN_SECONDS", "30"))
+
+# In-memory LRU tier of the content-hash embedding cache (entries per process);
+# the on-disk tier lives in MEDIA_ROOT/embedding_cache
+FACE_EMBEDDING_CACHE_SIZE = int(os.getenv("FACE_EMBEDDING_CACHE_SIZE", "2048"))
+
+# 1:N face index: 0 lists = exact search; >0 enables IVF (k-means) partitioning
+# for large galleries (e.g. ~sqrt(N) lists, probing a handful of them)
+FACE_INDEX_IVF_LISTS = int(os.getenv("FACE_INDEX_IVF_LISTS", "0"))
+FACE_INDEX_IVF_PROBES = int(os.getenv("FACE_INDEX_IVF_PROBES", "8"))
+
+# Workers check for enrollment/approval events (GalleryEvent) at most this often
+# and re-read only the users that changed; once this many users are pending on
+# top of the shared snapshot, one worker folds them into a new snapshot
+FACE_INDEX_POLL_SECONDS = float(os.getenv("FACE_INDEX_POLL_SECONDS", "2"))
+FACE_INDEX_COMPACT_USERS = int(os.getenv("FACE_INDEX_COMPACT_USERS", "200"))
+
 # --- TEMPLATES ---
 TEMPLATES = [
     {
@@ -1,9 +1,10 @@
 import os
 from django.conf import settings
 from django.http import JsonResponse
-from deepface import DeepFace
 
 def verify_faces(request):
+    from deepface import DeepFace
+
     try:
         # Pick two sample images from your face DB
         img1 = os.path.join(settings.MEDIA_ROOT, "faces", "FCA@123", "FCA@123_2.jpg")